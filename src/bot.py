@@ -227,25 +227,24 @@ def reschedule_queue(message: tg.telegram_types.Message, help_message: tg.telegr
         help_message (telegram.telegram_types.Message, optional): The help message to be deleted. Defaults to None.
     """
     can_be_deleted = True
+    current_time = datetime.now()
+    schedule = []
     for item in message.text.split('\n'):
         item = item.split(': scheduled for ')
         post_id = item[0].strip()
         new_scheduled_time = datetime.strptime(item[1].strip(), '%Y-%m-%d %H:%M:%S.%f')
         if (
             isinstance(post_id, str) and len(post_id) == 11 and
-            isinstance(new_scheduled_time, datetime) and new_scheduled_time > datetime.now()
+            isinstance(new_scheduled_time, datetime) and new_scheduled_time > current_time
         ):
-            database.update_schedule_time_in_queue(
-                post_id=post_id,
-                user_id=message.chat.id,
-                scheduled_time=new_scheduled_time
-            )
+            schedule.append((post_id, new_scheduled_time))
         else:
             can_be_deleted = False
             tg.send_styled_message(
                 chat_id=message.chat.id,
-                messages_template={'alias': 'wrong_reschedule_queue', 'kwargs': {'current_time': datetime.now()}}
+                messages_template={'alias': 'wrong_reschedule_queue', 'kwargs': {'current_time': current_time}}
             )
+    database.update_schedule_times_in_queue(user_id=message.chat.id, schedule=schedule)
     if can_be_deleted:
         tg.delete_message(message.chat.id, message.id)
     if help_message is not None:
@@ -3,8 +3,36 @@
 Migrates historical data from the Vault to the processed table in the database.
 https://github.com/obervinov/pyinstabot-downloader/issues/30
 """
+import csv
+import io
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
 VERSION = '1.0'
 NAME = '0001_vault_historical_data'
+# the posts of an owner are written with COPY when there are more of them than this number, otherwise with a multi-row INSERT
+COPY_THRESHOLD = 1000
+# sql templates
+INSERT_QUERY = sql.SQL("INSERT INTO {table} ({columns}) VALUES %s")
+COPY_QUERY = sql.SQL("COPY {table} ({columns}) FROM STDIN WITH (FORMAT CSV)")
+
+
+def copy_posts(cursor, query: sql.Composed = None, rows: list = None) -> None:
+    """
+    Bulk load the rows to the processed table using COPY FROM STDIN.
+
+    Args:
+        cursor: A cursor of the database connection.
+        query (sql.Composed): The COPY query of the processed table.
+        rows (list): A list of rows of the processed table.
+
+    Returns:
+        None
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(query, buffer)
 
 
 def execute(obj):
@@ -19,7 +47,11 @@ def execute(obj):
     """
     # database settings
     table_name = 'processed'
-    columns = 'user_id, post_id, post_url, post_owner, link_type, message_id, chat_id, download_status, upload_status, state'
+    columns = ('user_id', 'post_id', 'post_url', 'post_owner', 'link_type', 'message_id', 'chat_id', 'download_status', 'upload_status', 'state')
+    table = sql.Identifier(table_name)
+    columns_list = sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    insert_query = INSERT_QUERY.format(table=table, columns=columns_list)
+    copy_query = COPY_QUERY.format(table=table, columns=columns_list)
 
     # information about owners
     try:
@@ -34,6 +66,7 @@ def execute(obj):
             posts_counter = len(posts)
             print(f"{NAME}: Founded {posts_counter} posts in history/{owner}")
 
+            rows = []
             for post in posts:
                 user_id = next(iter(obj.vault.kv2eninge.read_secret(path='configuration/users').keys()))
                 post_id = post
@@ -46,26 +79,19 @@ def execute(obj):
                 upload_status = 'completed'
                 state = 'processed'
 
-                values = (
-                    f"'{user_id}', "
-                    f"'{post_id}', "
-                    f"'{post_url}', "
-                    f"'{post_owner}', "
-                    f"'{link_type}', "
-                    f"'{message_id}', "
-                    f"'{chat_id}', "
-                    f"'{download_status}', "
-                    f"'{upload_status}', "
-                    f"'{state}'"
-                )
+                rows.append((user_id, post_id, post_url, post_owner, link_type, message_id, chat_id, download_status, upload_status, state))
 
-                print(f"{NAME}: Migrating {post_id} from history/{owner}")
-                conn = obj.get_connection()
-                with conn.cursor() as cursor:
-                    cursor.execute(f"INSERT INTO {table_name} ({columns}) VALUES ({values})")
-                conn.commit()
-                print(f"{NAME}: Post {post_id} from history/{owner} has been added to processed table")
-        obj.close_connection(conn)
+            # all posts of the owner are written with a single statement and one commit
+            print(f"{NAME}: Migrating {len(rows)} posts from history/{owner}")
+            conn = obj.get_connection()
+            with conn.cursor() as cursor:
+                if len(rows) > COPY_THRESHOLD:
+                    copy_posts(cursor=cursor, query=copy_query, rows=rows)
+                else:
+                    execute_values(cursor, insert_query, rows, page_size=1000)
+            conn.commit()
+            obj.close_connection(conn)
+            print(f"{NAME}: Posts from history/{owner} have been added to processed table")
         print(f"{NAME}: Migration has been completed")
     # Will be fixed after the issue https://github.com/obervinov/vault-package/issues/46 is resolved
     # pylint: disable=broad-exception-caught
@@ -3,8 +3,16 @@
 Add additional column 'created_at' and replace column 'timestamp' with 'updated_at' in the messages table.
 https://github.com/obervinov/pyinstabot-downloader/issues/62
 """
+from psycopg2 import sql
+
 VERSION = '1.0'
 NAME = '0002_messages_table'
+# sql templates
+TABLE_QUERY = sql.SQL("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;")
+COLUMNS_QUERY = sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s;")
+RENAME_COLUMN_QUERY = sql.SQL("ALTER TABLE {table} RENAME COLUMN {name} TO {new_name}")
+ALTER_TABLE_QUERY = sql.SQL("ALTER TABLE {table} {action}")
+ADD_COLUMN_QUERY = sql.SQL("ADD COLUMN {name} {type} DEFAULT {default}")
 
 
 def execute(obj):
@@ -27,11 +35,11 @@ def execute(obj):
     with conn.cursor() as cursor:
         # check if the table exists and has the necessary schema for execute the migration
         # check table
-        cursor.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;", (table_name,))
+        cursor.execute(TABLE_QUERY, (table_name,))
         table = cursor.fetchone()
 
         # check columns in the table
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s;", (table_name,))
+        cursor.execute(COLUMNS_QUERY, (table_name,))
         columns = [row[0] for row in cursor.fetchall()]
 
         if not table:
@@ -47,7 +55,11 @@ def execute(obj):
             for column in rename_columns:
                 try:
                     print(f"{NAME}: Rename column {column[0]} to {column[1]} in the {table_name} table...")
-                    cursor.execute(f"ALTER TABLE {table_name} RENAME COLUMN {column[0]} TO {column[1]}")
+                    cursor.execute(
+                        RENAME_COLUMN_QUERY.format(
+                            table=sql.Identifier(table_name), name=sql.Identifier(column[0]), new_name=sql.Identifier(column[1])
+                        )
+                    )
                     conn.commit()
                     print(f"{NAME}: Column {column[0]} has been renamed to {column[1]} in the {table_name} table.")
                 except obj.errors.DuplicateColumn as error:
@@ -63,7 +75,12 @@ def execute(obj):
                 else:
                     try:
                         print(f"{NAME}: Add column {column[0]} to the {table_name} table...")
-                        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column[0]} {column[1]} DEFAULT {column[2]}")
+                        cursor.execute(
+                            ALTER_TABLE_QUERY.format(
+                                table=sql.Identifier(table_name),
+                                action=ADD_COLUMN_QUERY.format(name=sql.Identifier(column[0]), type=sql.SQL(column[1]), default=sql.SQL(column[2]))
+                            )
+                        )
                         conn.commit()
                         print(f"{NAME}: Column {column[0]} has been added to the {table_name} table.")
                     except obj.errors.DuplicateColumn as error:
@@ -3,8 +3,17 @@
 Add additional column 'status' in the users table.
 https://github.com/obervinov/users-package/blob/v3.0.0/tests/postgres/tables.sql
 """
+from psycopg2 import sql
+
 VERSION = '1.0'
 NAME = '0003_users_table'
+# sql templates
+TABLE_QUERY = sql.SQL("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;")
+COLUMNS_QUERY = sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s;")
+ALTER_TABLE_QUERY = sql.SQL("ALTER TABLE {table} {action}")
+ADD_COLUMN_QUERY = sql.SQL("ADD COLUMN {name} {type} DEFAULT {default}")
+SET_NOT_NULL_QUERY = sql.SQL("ALTER TABLE {table} ALTER COLUMN {name} SET NOT NULL;")
+ADD_UNIQUE_QUERY = sql.SQL("ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE ({name});")
 
 
 def execute(obj):
@@ -27,39 +36,52 @@ def execute(obj):
     conn = obj.get_connection()
     with conn.cursor() as cursor:
         # check table
-        cursor.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;", (table_name,))
+        cursor.execute(TABLE_QUERY, (table_name,))
         table = cursor.fetchone()
 
         # check columns in the table
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s;", (table_name,))
-        columns = [row[0] for row in cursor.fetchall()]
+        cursor.execute(COLUMNS_QUERY, (table_name,))
+        columns = {row[0] for row in cursor.fetchall()}
 
         if not table:
             print(f"{NAME}: The {table_name} table does not exist. Skip the migration.")
 
         else:
-            for column in add_columns:
-                if column[0] in columns:
-                    print(f"{NAME}: The {table_name} table already has the {column[0]} column. Skip adding.")
-                else:
-                    try:
-                        print(f"{NAME}: Add column {column[0]} to the {table_name} table...")
-                        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column[0]} {column[1]} DEFAULT {column[2]}")
-                        conn.commit()
-                        print(f"{NAME}: Column {column[0]} has been added to the {table_name} table.")
-                    except obj.errors.DuplicateColumn as error:
-                        print(f"{NAME}: Columns in the {table_name} table have already been added. Skip adding: {error}")
-                        conn.rollback()
-                    except obj.errors.FeatureNotSupported as error:
-                        print(f"{NAME}: Columns in the {table_name} table have not been added. Skip adding: {error}")
-                        conn.rollback()
+            # only the missing columns are sent to the server, all of them in a single ALTER TABLE statement
+            missing_columns = [column for column in add_columns if column[0] not in columns]
+            if not missing_columns:
+                print(f"{NAME}: The {table_name} table already has the {[column[0] for column in add_columns]} columns. Skip adding.")
+            else:
+                try:
+                    print(f"{NAME}: Add columns {[column[0] for column in missing_columns]} to the {table_name} table...")
+                    cursor.execute(
+                        ALTER_TABLE_QUERY.format(
+                            table=sql.Identifier(table_name),
+                            action=sql.SQL(', ').join(
+                                ADD_COLUMN_QUERY.format(name=sql.Identifier(column[0]), type=sql.SQL(column[1]), default=sql.SQL(column[2]))
+                                for column in missing_columns
+                            )
+                        )
+                    )
+                    conn.commit()
+                    print(f"{NAME}: Columns {[column[0] for column in missing_columns]} have been added to the {table_name} table.")
+                except obj.errors.DuplicateColumn as error:
+                    print(f"{NAME}: Columns in the {table_name} table have already been added. Skip adding: {error}")
+                    conn.rollback()
+                except obj.errors.FeatureNotSupported as error:
+                    print(f"{NAME}: Columns in the {table_name} table have not been added. Skip adding: {error}")
+                    conn.rollback()
 
             for column in update_columns:
                 if column[0] in columns:
                     try:
                         print(f"{NAME}: Alter column {column[0]} to {column[2]}...")
-                        cursor.execute(f"ALTER TABLE {table_name} ALTER COLUMN {column[0]} SET NOT NULL;")
-                        cursor.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {column[0]}_unique UNIQUE ({column[0]});")
+                        cursor.execute(SET_NOT_NULL_QUERY.format(table=sql.Identifier(table_name), name=sql.Identifier(column[0])))
+                        cursor.execute(
+                            ADD_UNIQUE_QUERY.format(
+                                table=sql.Identifier(table_name), constraint=sql.Identifier(f"{column[0]}_unique"), name=sql.Identifier(column[0])
+                            )
+                        )
                         conn.commit()
                         print(f"{NAME}: Column {column[0]} has been updated to {column[2]}.")
                     # pylint: disable=broad-exception-caught
@@ -68,3 +90,4 @@ def execute(obj):
                         conn.rollback()
                 else:
                     print(f"{NAME}: The {table_name} table does not have the {column[0]} column. Skip updating.")
+    obj.close_connection(conn)
@@ -3,13 +3,77 @@
 Migration for the vault users data to the users table in the database.
 https://github.com/obervinov/users-package/blob/v3.0.0/tests/postgres/tables.sql
 """
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
 VERSION = '1.0'
 NAME = '0004_vault_users_data'
+# the number of users read from the vault and written to the database at once
+CHUNK_SIZE = 256
+# the number of parallel requests to the vault
+VAULT_WORKERS = 8
+# sql templates
+TABLE_QUERY = sql.SQL("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;")
+POPULATED_QUERY = sql.SQL("SELECT EXISTS(SELECT 1 FROM {table})")
+COPY_QUERY = sql.SQL("COPY {table} (user_id, chat_id, status) FROM STDIN WITH (FORMAT CSV)")
+INSERT_QUERY = sql.SQL("INSERT INTO {table} (user_id, chat_id, status) VALUES %s ON CONFLICT (user_id) DO NOTHING")
+
+
+def read_user(obj, user: str = None) -> tuple:
+    """
+    Read the last state of the user from the vault and convert it to the row of the users table.
+
+    Args:
+        obj: An obj containing the database connection and cursor, as well as the Vault instance.
+        user (str): The ID of the user.
+
+    Returns:
+        tuple: A row for the users table (user_id, chat_id, status).
+    """
+    user_last_state = obj.json.loads(obj.vault.kv2engine.read_secret(path=f"data/users/{user}", key='authentication'))
+    return (user, 'unknown', user_last_state.get('status', 'unknown'))
+
+
+def copy_users(cursor, table_name: str = None, rows: list = None) -> None:
+    """
+    Bulk load the rows to the users table using COPY FROM STDIN.
+
+    Args:
+        cursor: A cursor of the database connection.
+        table_name (str): The name of the users table.
+        rows (list): A list of rows (user_id, chat_id, status).
+
+    Returns:
+        None
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(COPY_QUERY.format(table=sql.Identifier(table_name)), buffer)
+
+
+def insert_users(cursor, table_name: str = None, rows: list = None) -> None:
+    """
+    Write the rows to the users table skipping the users that already exist.
+
+    Args:
+        cursor: A cursor of the database connection.
+        table_name (str): The name of the users table.
+        rows (list): A list of rows (user_id, chat_id, status).
+
+    Returns:
+        None
+    """
+    execute_values(cursor, INSERT_QUERY.format(table=sql.Identifier(table_name)), rows)
 
 
 def execute(obj):
     """
     Migration for the vault users data to the users table in the database.
+    Users are processed in chunks: the secrets of the next chunk are read from the vault while the current chunk is written to the database.
 
     Args:
         obj: An obj containing the database connection and cursor, as well as the Vault instance.
@@ -24,7 +88,7 @@ def execute(obj):
     # check if the table exists for execute the migration
     conn = obj.get_connection()
     with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s;", (table_name,))
+        cursor.execute(TABLE_QUERY, (table_name,))
         table = cursor.fetchone()
 
         if not table:
@@ -32,24 +96,32 @@ def execute(obj):
 
         else:
             try:
+                # the users package may have already written some users, they are kept and only the missing ones are added
+                cursor.execute(POPULATED_QUERY.format(table=sql.Identifier(table_name)))
+                populated = cursor.fetchone()[0]
                 users = obj.vault.kv2engine.list_secrets(path='data/users')
                 users_counter = len(users)
                 print(f"{NAME}: Founded {users_counter} users in users data")
 
-                for user in users:
-                    user_last_state = obj.json.loads(obj.vault.kv2engine.read_secret(path=f"data/users/{user}", key='authentication'))
-
-                    user_id = user
-                    chat_id = 'unknown'
-                    status = user_last_state.get('status', 'unknown')
-
-                    values = f"'{user_id}', '{chat_id}', '{status}'"
+                with ThreadPoolExecutor(max_workers=VAULT_WORKERS) as executor:
+                    pending = [executor.submit(read_user, obj, user) for user in users[:CHUNK_SIZE]]
+                    for offset in range(0, users_counter, CHUNK_SIZE):
+                        current = pending
+                        pending = [executor.submit(read_user, obj, user) for user in users[offset + CHUNK_SIZE:offset + 2 * CHUNK_SIZE]]
+                        rows = [future.result() for future in current]
 
-                    print(f"{NAME}: Migrating user {user_id} to the {table_name} table...")
-                    with conn.cursor() as cursor:
-                        cursor.execute(f"INSERT INTO {table_name} (user_id, chat_id, status) VALUES ({values})")
+                        print(f"{NAME}: Migrating users {[row[0] for row in rows]} to the {table_name} table...")
+                        if populated:
+                            # COPY can't skip existing rows, so the chunks are written with the upsert semantic
+                            insert_users(cursor=cursor, table_name=table_name, rows=rows)
+                        else:
+                            try:
+                                copy_users(cursor=cursor, table_name=table_name, rows=rows)
+                            except obj.errors.UniqueViolation:
+                                conn.rollback()
+                                insert_users(cursor=cursor, table_name=table_name, rows=rows)
                         conn.commit()
-                        print(f"{NAME}: User {user_id} has been added to the {table_name} table")
+                        print(f"{NAME}: Users {[row[0] for row in rows]} have been added to the {table_name} table")
                 print(f"{NAME}: Migration has been completed")
             # pylint: disable=broad-exception-caught
             except Exception as migration_error:
@@ -57,4 +129,5 @@ def execute(obj):
                     f"{NAME}: Migration cannot be completed due to an error: {migration_error}. "
                     "It's not a critical error, so the migration will be skipped."
                 )
+                conn.rollback()
         obj.close_connection(conn)
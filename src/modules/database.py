@@ -1,32 +1,210 @@
 """This module contains a class for interacting with a PostgreSQL database using psycopg2"""
 import os
-import sys
-import importlib
+import re
+import importlib.util
+import itertools
+import hashlib
 import json
+import random
 import time
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import pool, sql
+from psycopg2.extras import execute_values, RealDictCursor
 from logger import log
-from .tools import get_hash
+from .tools import get_hash, TTLCache
+
+# the columns of the queue table filled in by the bot when a message is added to the queue
+QUEUE_COLUMNS = (
+    "user_id", "post_id", "post_url", "post_owner", "link_type", "message_id", "chat_id", "scheduled_time", "download_status", "upload_status"
+)
+# the row template of the queue table with the explicit type cast of the scheduled time
+QUEUE_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s::timestamp, %s, %s)"
+# read-mostly tables whose select results are cached for SELECT_CACHE_TTL seconds
+CACHEABLE_TABLES = ('users', 'migrations', 'accounts')
+SELECT_CACHE_TTL = 30
+# the maximum number of (message_type, chat_id) entries kept in the messages cache
+MESSAGES_CACHE_SIZE = 10000
+# the service messages returned by get_considered_message() are cached for this number of seconds
+CONSIDERED_CACHE_TTL = 5
+# a connection that has been idle in the pool longer than this number of seconds is probed with SELECT 1 before it is checked out
+IDLE_PROBE_AFTER = 30
+# the TCP keepalives of the connections, so the connections broken on the network level are detected by the OS
+KEEPALIVES = {'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+# the attempts to restore the lost connection to the database, the delay between them grows exponentially from the base up to the cap
+RECONNECT_RETRIES = 5
+RECONNECT_BASE_DELAY = 0.1
+RECONNECT_MAX_DELAY = 2.0
+# the number of rows fetched per round-trip by the server-side cursors
+SCAN_ITERSIZE = 1000
+# the maximum number of the queries of the helpers prepared in a session, the least recently used statement is deallocated
+PREPARED_CACHE_SIZE = 256
+# the placeholders of psycopg2 in the query text: the %% escape of the percent sign and the positional %s placeholder
+PLACEHOLDER_PATTERN = re.compile(r"%%|%s")
+# server-side prepared statements for the hot queries, they are prepared once per connection on first use
+PREPARED_STATEMENTS = {
+    'queue_due': (
+        "PREPARE queue_due(timestamp) AS SELECT id, user_id, post_id, post_url, post_owner, link_type, message_id, chat_id, "
+        "scheduled_time, download_status, upload_status, state FROM queue WHERE scheduled_time <= $1 AND state IN ('waiting', 'processing') "
+        "ORDER BY scheduled_time ASC LIMIT 1"
+    ),
+    'uniq': (
+        "PREPARE uniq(varchar, varchar) AS SELECT EXISTS(SELECT 1 FROM queue WHERE post_id = $1 AND user_id = $2) "
+        "OR EXISTS(SELECT 1 FROM processed WHERE post_id = $1 AND user_id = $2)"
+    ),
+    'user_queue': (
+        "PREPARE user_queue(varchar) AS SELECT post_id, scheduled_time FROM queue WHERE user_id = $1 ORDER BY scheduled_time ASC LIMIT 10000"
+    ),
+    'queue_reschedule': (
+        "PREPARE queue_reschedule(timestamp, varchar, varchar) AS UPDATE queue SET scheduled_time = $1 WHERE post_id = $2 AND user_id = $3"
+    ),
+    # a single statement shape for all state updates: the optional columns keep the current value when NULL is passed
+    'queue_state': (
+        "PREPARE queue_state(varchar, varchar, varchar, varchar, varchar) AS UPDATE queue SET state = $1, post_owner = COALESCE($2, post_owner), "
+        "download_status = COALESCE($3, download_status), upload_status = COALESCE($4, upload_status) WHERE post_id = $5"
+    ),
+    'queue_processed': (
+        "PREPARE queue_processed(varchar, varchar, varchar, varchar, varchar) AS WITH moved AS ("
+        "DELETE FROM queue WHERE post_id = $1 RETURNING user_id, post_id, post_url, post_owner, link_type, message_id, chat_id"
+        ") INSERT INTO processed (user_id, post_id, post_url, post_owner, link_type, message_id, chat_id, download_status, upload_status, state) "
+        "SELECT user_id, post_id, post_url, COALESCE($2, post_owner), link_type, message_id, chat_id, $3, $4, $5 FROM moved RETURNING message_id"
+    ),
+    # an upsert of the service message in one round-trip: the existing row is updated only if it has changed (or it is recreated),
+    # otherwise a new row is inserted; the result is the row and the action: 'kept', 'updated' or 'unchanged'.
+    # FOR UPDATE locks only the existing row, the first insert of the message is guarded by the advisory lock of the caller
+    'message_keep': (
+        "PREPARE message_keep(varchar, varchar, varchar, varchar, varchar, boolean) AS WITH existing AS ("
+        "SELECT id, message_id, message_content_hash, state FROM messages WHERE message_type = $1 AND chat_id = $2 LIMIT 1 FOR UPDATE"
+        "), updated AS ("
+        "UPDATE messages SET message_content_hash = $4, message_id = $3, state = $5, updated_at = CURRENT_TIMESTAMP, "
+        "created_at = CASE WHEN $6 THEN CURRENT_TIMESTAMP ELSE messages.created_at END FROM existing WHERE messages.id = existing.id "
+        "AND ($6 OR (existing.message_id, existing.message_content_hash, existing.state) IS DISTINCT FROM ($3, $4, $5)) "
+        "RETURNING messages.id, messages.message_id, messages.message_content_hash, messages.state"
+        "), inserted AS ("
+        "INSERT INTO messages (message_id, chat_id, message_type, message_content_hash, producer) "
+        "SELECT $3, $2, $1, $4, 'bot' WHERE NOT EXISTS (SELECT 1 FROM existing) RETURNING id, message_id, message_content_hash, state"
+        ") SELECT *, 'kept' FROM inserted UNION ALL SELECT *, 'updated' FROM updated "
+        "UNION ALL SELECT *, 'unchanged' FROM existing WHERE NOT EXISTS (SELECT 1 FROM updated)"
+    ),
+    'considered_message': (
+        "PREPARE considered_message(varchar, varchar) AS SELECT message_id, chat_id, created_at, updated_at, message_content_hash, state "
+        "FROM messages WHERE message_type = $1 AND chat_id = $2 LIMIT 1"
+    )
+}
+# the templates of the schema preparation, the column definitions and the index condition are taken from the configuration as is
+CREATE_TABLE_TEMPLATE = "CREATE TABLE IF NOT EXISTS {table} ({columns})"
+CREATE_INDEX_TEMPLATE = "CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+# the templates of the helper queries, the identifiers and the clauses are composed by DatabaseClient._compose()
+INSERT_TEMPLATE = "INSERT INTO {table} ({columns}) VALUES %s"
+INSERT_CONFLICT_TEMPLATE = INSERT_TEMPLATE + " ON CONFLICT ({conflict_target}) DO NOTHING"
+UPDATE_TEMPLATE = "UPDATE {table} SET {values} WHERE {condition}"
+DELETE_TEMPLATE = "DELETE FROM {table} WHERE {condition}"
+# an upsert of the account that needs only the changed columns: the existing account is updated, otherwise a new one is inserted
+# (INSERT ... ON CONFLICT can't be used, the NOT NULL columns of the proposed row are checked before the conflict even for an update)
+ACCOUNT_UPSERT_TEMPLATE = (
+    "WITH updated AS (UPDATE {table} SET {values} WHERE username = %s RETURNING id) "
+    "INSERT INTO {table} ({columns}) SELECT {placeholders} WHERE NOT EXISTS (SELECT 1 FROM updated)"
+)
+# the static queries of the client
+SCHEMA_META_QUERY = "SELECT to_regclass('schema_meta')"
+SCHEMA_DIGEST_QUERY = "SELECT value FROM schema_meta WHERE name = %s"
+SCHEMA_DIGEST_UPSERT_QUERY = (
+    "INSERT INTO schema_meta (name, value) VALUES (%s, %s) "
+    "ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP"
+)
+QUEUE_SCHEDULE_QUERY = (
+    "UPDATE queue SET scheduled_time = data.scheduled_time FROM (VALUES %s) AS data(post_id, scheduled_time, user_id) "
+    "WHERE queue.post_id = data.post_id AND queue.user_id = data.user_id"
+)
+QUEUE_SCHEDULE_TEMPLATE = "(%s, %s::timestamp, %s)"
+MESSAGES_STATS_QUERY = (
+    "SELECT "
+    "(SELECT COUNT(*) FROM processed WHERE user_id IN (SELECT user_id FROM users)), "
+    "(SELECT COUNT(*) FROM queue WHERE user_id IN (SELECT user_id FROM users))"
+)
+
+
+@functools.lru_cache(maxsize=4)
+def load_database_configuration(path: str = None) -> tuple:
+    """
+    Read the database initialization configuration file. The file is parsed once per process for each path.
+
+    Args:
+        path (str): The absolute path to the configuration file.
+
+    Returns:
+        tuple: The database initialization configuration (tables, indexes and data seeding) and the sha256 digest of the file.
+    """
+    with open(path, 'rb') as config_file:
+        raw_configuration = config_file.read()
+    return json.loads(raw_configuration), hashlib.sha256(raw_configuration).hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def list_migrations(path: str = None) -> tuple:
+    """
+    List the migration files in the order of their numbering. The directory is listed once per process for each path.
+
+    Args:
+        path (str): The absolute path to the migrations directory.
+
+    Returns:
+        tuple: The sorted names of the migration files.
+    """
+    return tuple(sorted(f for f in os.listdir(path) if f.endswith('.py')))
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    A connection to the PostgreSQL database that keeps track of the statements prepared in its session and of its age.
+    Prepared statements live as long as the session, so a new connection after a reconnect starts with an empty set.
+    The named statements from PREPARED_STATEMENTS are kept in `prepared_statements`,
+    the queries of the helpers are kept in `prepared_queries` in the order of their use.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.prepared_queries = OrderedDict()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
 
 
 def reconnect_on_exception(method):
     """
-    A decorator that catches the closed cursor exception and reconnects to the database.
+    A decorator that catches the lost connection exceptions and reconnects to the database.
+    Only connection-level errors trigger the reconnect, query errors (syntax, constraints, privileges) are raised as is.
+    The method is retried up to RECONNECT_RETRIES times with the exponential backoff, so a short network blip doesn't stall the bot threads for long.
+    The delay is randomized (full jitter), so the bot threads don't retry all at once after the database is back.
+    The broken connection is discarded by the pool, so the first retry checks out another connection from the same pool,
+    the pool is rebuilt only if the database is still unreachable.
+    A method called with the connection of the caller is not retried: the retry would run on the same broken connection,
+    the caller owns the transaction and handles the error itself.
     """
     def wrapper(self, *args, **kwargs):
         try:
             return method(self, *args, **kwargs)
-        except psycopg2.Error as exception:
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as exception:
+            if kwargs.get('connection', None) is not None:
+                raise
             log.warning('[Database]: Connection to the database was lost: %s. Attempting to reconnect...', str(exception))
-            time.sleep(5)
-            try:
-                self.database_connections = self.create_connection_pool()
-                log.info('[Database]: Reconnection successful.')
-                return method(self, *args, **kwargs)
-            except psycopg2.Error as inner_exception:
-                log.error('[Database]: Failed to reconnect to the database: %s', str(inner_exception))
-                raise inner_exception
+            reconnected = False
+            for attempt in range(1, RECONNECT_RETRIES + 1):
+                time.sleep(random.uniform(0, min(RECONNECT_BASE_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)))
+                try:
+                    if attempt > 1 and not reconnected:
+                        self.replace_connection_pool()
+                        reconnected = True
+                    response = method(self, *args, **kwargs)
+                    log.info('[Database]: Reconnection successful.')
+                    return response
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as inner_exception:
+                    log.warning('[Database]: Reconnection attempt %s/%s failed: %s', attempt, RECONNECT_RETRIES, str(inner_exception))
+                    exception = inner_exception
+            log.error('[Database]: Failed to reconnect to the database: %s', str(exception))
+            raise exception
     return wrapper
 
 
@@ -35,7 +213,8 @@ class DatabaseClient:
     A class that represents a client for interacting with a PostgreSQL database.
 
     Attributes:
-        database_connections (psycopg2.extensions.connection): A connection to the PostgreSQL database.
+        database_connections (pool.ThreadedConnectionPool): A thread-safe pool of connections to the PostgreSQL database.
+        max_connection_age (int): The maximum age of a connection in seconds after which it is closed instead of being returned to the pool.
         vault (object): An object representing a HashiCorp Vault client for retrieving secrets.
         db_role (str): The role to use for generating database credentials.
         errors (psycopg2.errors): A collection of error classes for exceptions raised by the psycopg2 module.
@@ -43,28 +222,42 @@ class DatabaseClient:
 
     Methods:
         create_connection_pool(): Create a connection pool for the PostgreSQL database.
+        replace_connection_pool(): Replace the connection pool with a new one and close the old pool.
         get_connection(): Get a connection from the connection pool.
+        _get_connection(connections): Check out an open connection from the pool.
         close_connection(connection): Close the connection and return it to the connection pool.
+        _conn(connection): Check out a connection from the pool for a single transaction or reuse the transaction of the caller.
         _prepare_db(): Prepare the database by creating and initializing the necessary tables.
         _migrations(): Execute database migrations to update the database schema or data.
-        _is_migration_executed(migration_name): Check if a migration has already been executed.
+        _get_executed_migrations(): Get the names of all migrations that have already been executed.
         _mark_migration_as_executed(migration_name, version): Inserts a migration into the migrations table to mark it as executed.
-        _create_table(table_name, columns): Create a new table in the database with the given name and columns if it does not already exist.
-        _insert(table_name, columns, values): Inserts a new row into the specified table with the given columns and values.
+        _create_tables(tables): Create the tables that do not exist yet in the database with a single round-trip.
+        _create_indexes(indexes): Create the indexes that do not exist yet in the database.
+        _get_schema_digest(): Get the digest of the configuration file from which the schema was prepared last time.
+        _set_schema_digest(digest): Save the digest of the configuration file from which the schema was prepared.
+        _insert(table_name, columns, values): Inserts one or more rows into the specified table with the given columns and values.
         _select(table_name, columns, **kwargs): Selects rows from the specified table with the given columns based on the specified condition.
-        _update(table_name, values, condition): Update the specified table with the given values of values based on the specified condition.
-        _delete(table_name, condition): Delete rows from a table based on a condition.
+        _select_iter(table_name, columns, **kwargs): Stream rows from the specified table as dictionaries using a server-side cursor.
+        _compose(template, table_name, columns, **clauses): Compose a query from the template with the quoted identifiers and cache it.
+        _execute_query(cursor, sql_query, params): Execute the query of a helper as a server-side prepared statement.
+        _execute_prepared(name, params): Execute a server-side prepared statement and return the selected rows.
+        _update(table_name, values, condition, params): Update the specified table with the given values of values based on the specified condition.
+        _delete(table_name, condition, params): Delete rows from a table based on a condition.
         _reset_stale_records(): Reset stale records in the database. To ensure that the bot is restored after a restart.
         add_message_to_queue(data): Add a message to the queue table in the database.
         get_message_from_queue(scheduled_time): Get a one message from the queue table that is scheduled to be sent at the specified time.
-        update_message_state_in_queue(post_id, state, **kwargs): Update the state of a message in the queue table and move it to the processed table
+        update_message_state_in_queue(post_id, state, **kwargs): Update the state of a message in the queue table or move it to the processed table
                                                                  if the state is 'processed'.
         update_schedule_time_in_queue(post_id, user_id, scheduled_time): Update the scheduled time of a message in the queue table.
+        update_schedule_times_in_queue(user_id, schedule): Update the scheduled time of several messages in the queue table with a single query.
         get_user_queue(user_id): Get messages from the queue table for the specified user.
         get_user_processed(user_id): Get last ten messages from the processed table for the specified user.
+        get_messages_stats(): Get the number of processed and queued messages of all known users.
         check_message_uniqueness(post_id, user_id): Check if a message with the given post ID and chat ID already exists in the queue.
         keep_message(message_id, chat_id, message_content, **kwargs): Add a message to the messages table in the database.
+        invalidate_message_cache(chat_id, message_type): Drop the cached messages table rows for the specified chat.
         get_users(only_allowed): Get a list of users from the users table in the database.
+        iter_users(only_allowed, itersize): Stream users from the users table in the database.
         get_considered_message(message_type, chat_id): Get a message with specified type and chat ID from the messages table in the database.
         add_account_info(data): Add account information to the accounts table in the database.
         get_account_info(account_name): Get the account information from the accounts table in the database.
@@ -91,22 +284,38 @@ class DatabaseClient:
         self.vault = vault
         self.db_role = db_role
         self.errors = psycopg2.errors
+        # (message_type, chat_id) -> (id, message_id, message_content_hash, state) of the rows in the messages table
+        self._messages_cache = OrderedDict()
+        self._messages_cache_lock = threading.Lock()
+        # the results of _select() for the CACHEABLE_TABLES, invalidated on writes through this client
+        self._select_cache = TTLCache(maxsize=256, ttl=SELECT_CACHE_TTL)
+        # (message_type, chat_id) -> the result of get_considered_message(), invalidated when the message is kept
+        self._considered_cache = TTLCache(maxsize=1024, ttl=CONSIDERED_CACHE_TTL)
+        # the composed queries of the helpers, keyed by the template, the table, the columns and the clauses
+        self._sql_cache = {}
+        # the database configuration and the connection string are read from the vault once and reused by the reconnects
+        self._db_configuration = None
+        self._db_dsn = None
         self.database_connections = self.create_connection_pool()
 
         self._prepare_db()
         self._migrations()
         self._reset_stale_records()
 
-    def create_connection_pool(self) -> pool.SimpleConnectionPool:
+    def create_connection_pool(self) -> pool.ThreadedConnectionPool:
         """
         Create a connection pool for the PostgreSQL database.
+        The pool is shared between the bot threads, so it must be thread-safe.
+        The optional `min_connections` (default 1) and `max_connection_age` (in seconds, disabled by default) are read from the configuration.
+        The configuration is read from the vault only once, so the reconnects don't wait for the vault to rebuild the pool.
 
         Returns:
-            pool.SimpleConnectionPool: A connection pool for the PostgreSQL database.
+            pool.ThreadedConnectionPool: A connection pool for the PostgreSQL database.
         """
         required_keys_configuration = {"host", "port", "dbname", "connections"}
         required_keys_credentials = {"username", "password"}
-        db_configuration = self.vault.kv2engine.read_secret(path='configuration/database')
+        # the configuration is static, but the credentials are dynamic and must be generated for each new pool
+        db_configuration = self._db_configuration or self.vault.kv2engine.read_secret(path='configuration/database')
         db_credentials = self.vault.dbengine.generate_credentials(role=self.db_role)
 
         if not db_configuration or not db_credentials:
@@ -116,15 +325,33 @@ class DatabaseClient:
         if missing_keys:
             raise KeyError("Missing keys in the database configuration or credentials: {missing_keys}")
 
+        if self._db_configuration is None:
+            self._db_configuration = db_configuration
+            self._db_dsn = psycopg2.extensions.make_dsn(
+                host=db_configuration['host'], port=db_configuration['port'], dbname=db_configuration['dbname']
+            )
+
         log.info(
             '[Database]: Creating a connection pool for the %s:%s/%s',
             db_configuration['host'], db_configuration['port'], db_configuration['dbname']
         )
+        self.max_connection_age = int(db_configuration.get('max_connection_age', 0))
         settings = {
-            'minconn': 1, 'maxconn': db_configuration['connections'], 'host': db_configuration['host'], 'port': db_configuration['port'],
-            'user': db_credentials['username'], 'password': db_credentials['password'], 'database': db_configuration['dbname']
+            'minconn': int(db_configuration.get('min_connections', 1)), 'maxconn': int(db_configuration['connections']),
+            'dsn': self._db_dsn, 'user': db_credentials['username'], 'password': db_credentials['password'],
+            'connection_factory': PreparedConnection, **KEEPALIVES
         }
-        return pool.SimpleConnectionPool(**settings)
+        return pool.ThreadedConnectionPool(**settings)
+
+    def replace_connection_pool(self) -> None:
+        """
+        Replace the connection pool with a new one and close all connections of the old pool.
+        The connections of the old pool that are still in use are closed as well, their callers get the lost connection error.
+        """
+        connections = self.database_connections
+        self.database_connections = self.create_connection_pool()
+        if connections is not None:
+            connections.closeall()
 
     def get_connection(self) -> psycopg2.extensions.connection:
         """
@@ -133,7 +360,7 @@ class DatabaseClient:
         Returns:
             psycopg2.extensions.connection: A connection to the PostgreSQL database.
         """
-        return self.database_connections.getconn()
+        return self._get_connection(connections=self.database_connections)
 
     def close_connection(self, connection: psycopg2.extensions.connection) -> None:
         """
@@ -142,29 +369,176 @@ class DatabaseClient:
         Args:
             connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
         """
-        self.database_connections.putconn(connection)
+        self._put_connection(connections=self.database_connections, connection=connection)
+
+    def _get_connection(self, connections: pool.ThreadedConnectionPool = None) -> psycopg2.extensions.connection:
+        """
+        Check out a connection from the pool, the connections that have already been closed are discarded instead of being returned.
+        A connection that has been idle longer than IDLE_PROBE_AFTER seconds is probed with SELECT 1 first,
+        so a connection broken while it was idle (e.g. by a restart of the database) is replaced before the caller uses it.
+
+        Args:
+            connections (pool.ThreadedConnectionPool): The pool from which the connection is checked out.
+
+        Returns:
+            psycopg2.extensions.connection: An open connection to the PostgreSQL database.
+        """
+        connection = connections.getconn()
+        while connection.closed or (time.monotonic() - connection.last_used > IDLE_PROBE_AFTER and not self._probe(connection)):
+            connections.putconn(connection, close=True)
+            connection = connections.getconn()
+        return connection
+
+    @staticmethod
+    def _probe(connection: psycopg2.extensions.connection = None) -> bool:
+        """
+        Check that the connection is still alive with the cheapest query.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
+
+        Returns:
+            bool: True if the connection is alive, False otherwise.
+        """
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+            log.warning('[Database]: The idle connection is broken and will be replaced: %s', error)
+            return False
+
+    def _put_connection(self, connections: pool.ThreadedConnectionPool = None, connection: psycopg2.extensions.connection = None) -> None:
+        """
+        Return the connection to the pool, the connection is closed instead if it is older than max_connection_age.
+        So long-lived connections are recycled and the pool opens new ones on demand.
+
+        Args:
+            connections (pool.ThreadedConnectionPool): The pool from which the connection was checked out.
+            connection (psycopg2.extensions.connection): A connection to the PostgreSQL database.
+        """
+        connection.last_used = time.monotonic()
+        # the pool has been replaced and closed by a reconnect while the connection was in use
+        if connections.closed:
+            connection.close()
+            return
+        expired = bool(self.max_connection_age) and connection.last_used - connection.created_at > self.max_connection_age
+        connections.putconn(connection, close=expired)
+
+    @contextmanager
+    def _conn(self, connection: psycopg2.extensions.connection = None):
+        """
+        Check out a connection from the pool for a single transaction.
+        The transaction is committed when the block exits normally and rolled back on an exception,
+        after that the connection is always returned to the pool.
+        If the caller passes its own connection, it is used as is:
+        the caller owns the transaction and commits it once for the whole logical operation.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller.
+
+        Yields:
+            psycopg2.extensions.connection: A connection to the PostgreSQL database.
+
+        Examples:
+            >>> with self._conn() as conn:
+            ...     with conn.cursor() as cursor:
+            ...         cursor.execute("SELECT 1")
+        """
+        if connection is not None:
+            yield connection
+            return
+        # keep a reference to the pool: it can be replaced by the reconnect decorator while the connection is in use
+        connections = self.database_connections
+        conn = self._get_connection(connections=connections)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            # a broken connection can't be rolled back, it is discarded by the pool
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._put_connection(connections=connections, connection=conn)
 
     def _prepare_db(self) -> None:
         """
-        Prepare the database by creating and initializing the necessary tables.
+        Prepare the database by creating and initializing the necessary tables and indexes.
         """
         # Read configuration file for database initialization
         configuration_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../configs/databases.json'))
-        with open(configuration_path, encoding='UTF-8') as config_file:
-            database_init_configuration = json.load(config_file)
-
-        # Create databases if does not exist
-        for table in database_init_configuration.get('Tables', None):
-            self._create_table(table_name=table['name'], columns="".join(f"{column}" for column in table['columns']))
-            log.info('[Database]: Prepare Database: create table `%s` (if does not exist)', table['name'])
-
-        # Write necessary data to the database (service records)
-        if database_init_configuration.get('DataSeeding', None):
-            # ! This code block needs to be improved after some service data will appear for filling,
-            # ! because this code creates duplicate lines each time the project is started.
-            for data in database_init_configuration['DataSeeding']:
-                self._insert(table_name=data['table'], columns=tuple(data['data'].keys()), values=tuple(data['data'].values()))
-                log.info('[Database]: Prepare Database: data seeding has been added to the `%s` table', data['table'])
+        database_init_configuration, schema_digest = load_database_configuration(path=configuration_path)
+
+        # The whole preparation is a single transaction with one commit
+        with self._conn() as conn:
+            # The schema has already been prepared from the same configuration file on one of the previous starts
+            if self._get_schema_digest(connection=conn) == schema_digest:
+                log.info('[Database]: Prepare Database: the schema is up to date with the configuration file, skip the preparation')
+                return
+
+            # Create databases if does not exist
+            self._create_tables(tables=database_init_configuration.get('Tables', None), connection=conn)
+            log.info(
+                '[Database]: Prepare Database: create tables %s (if does not exist)',
+                [table['name'] for table in database_init_configuration.get('Tables', None)]
+            )
+
+            # Create indexes if does not exist
+            indexes_created = True
+            if database_init_configuration.get('Indexes', None):
+                indexes_created = self._create_indexes(indexes=database_init_configuration['Indexes'], connection=conn)
+
+            # Write necessary data to the database (service records)
+            if database_init_configuration.get('DataSeeding', None):
+                # Rows with the same table and columns are written with a single query.
+                # The optional `conflict_target` (a unique column list) makes the seeding idempotent between the restarts.
+                seeding = {}
+                for data in database_init_configuration['DataSeeding']:
+                    seeding.setdefault(
+                        (data['table'], tuple(data['data'].keys()), data.get('conflict_target', None)), []
+                    ).append(tuple(data['data'].values()))
+                for (table_name, columns, conflict_target), rows in seeding.items():
+                    self._insert(table_name=table_name, columns=columns, values=rows, conflict_target=conflict_target, connection=conn)
+                    log.info('[Database]: Prepare Database: data seeding has been added to the `%s` table (%s rows)', table_name, len(rows))
+
+            # The skipped indexes must be retried on the next start, so the digest is saved only for the complete schema
+            if indexes_created:
+                self._set_schema_digest(digest=schema_digest, connection=conn)
+
+    def _get_schema_digest(self, connection: psycopg2.extensions.connection = None) -> str | None:
+        """
+        Get the digest of the configuration file from which the schema was prepared last time.
+
+        Args:
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
+
+        Returns:
+            str: The sha256 digest of the configuration file.
+                or
+            None: if the schema has never been prepared (or the schema_meta table doesn't exist yet).
+        """
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SCHEMA_META_QUERY)
+                if cursor.fetchone()[0] is None:
+                    return None
+                cursor.execute(SCHEMA_DIGEST_QUERY, ('schema_digest',))
+                digest = cursor.fetchone()
+        return digest[0] if digest else None
+
+    def _set_schema_digest(self, digest: str = None, connection: psycopg2.extensions.connection = None) -> None:
+        """
+        Save the digest of the configuration file from which the schema was prepared.
+
+        Args:
+            digest (str): The sha256 digest of the configuration file.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
+        """
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SCHEMA_DIGEST_UPSERT_QUERY, ('schema_digest', digest))
 
     def _migrations(self) -> None:
         """
@@ -173,36 +547,38 @@ class DatabaseClient:
         log.info('[Database]: Migrations: Preparing to execute database migrations...')
         # Migrations directory
         migrations_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../migrations'))
-        sys.path.append(migrations_dir)
-        migration_files = [f for f in os.listdir(migrations_dir) if f.endswith('.py')]
-        migration_files.sort()
+        migration_files = list_migrations(path=migrations_dir)
+        executed_migrations = self._get_executed_migrations()
 
         for migration_file in migration_files:
             if migration_file.endswith('.py'):
                 migration_module_name = migration_file[:-3]
 
-                if not self._is_migration_executed(migration_name=migration_module_name):
+                if migration_module_name not in executed_migrations:
                     log.info('[Database]: Migrations: executing the %s migration...', migration_module_name)
-                    migration_module = importlib.import_module(name=migration_module_name)
+                    # only pending migrations are loaded, directly from the file without changing sys.path
+                    spec = importlib.util.spec_from_file_location(migration_module_name, os.path.join(migrations_dir, migration_file))
+                    migration_module = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(migration_module)
                     migration_module.execute(self)
                     version = getattr(migration_module, 'VERSION', migration_module_name)
                     self._mark_migration_as_executed(migration_name=migration_module_name, version=version)
+                    executed_migrations.add(migration_module_name)
                 else:
                     log.info('[Database] Migrations: the %s has already been executed and was skipped', migration_module_name)
             else:
                 log.error('[Database]: Migrations: the %s is not a valid migration file', migration_file)
 
-    def _is_migration_executed(self, migration_name: str = None) -> bool:
+    def _get_executed_migrations(self) -> set:
         """
-        Check if a migration has already been executed.
-
-        Args:
-            migration_name (str): The name of the migration to check.
+        Get the names of all migrations that have already been executed.
+        The whole history is read with a single query instead of checking each migration file separately.
 
         Returns:
-            bool: True if the migration has been executed, False otherwise.
+            set: A set of the names of the executed migrations.
         """
-        return self._select(table_name='migrations', columns=('id',), condition=f"name = '{migration_name}'")
+        migrations = self._select(table_name='migrations', columns=('name',))
+        return {migration[0] for migration in migrations} if migrations else set()
 
     def _mark_migration_as_executed(self, migration_name: str = None, version: str = None) -> None:
         """
@@ -213,33 +589,103 @@ class DatabaseClient:
         """
         self._insert(table_name='migrations', columns=('name', 'version'), values=(migration_name, version))
 
-    def _create_table(self, table_name: str = None, columns: str = None) -> None:
+    def _create_tables(self, tables: list = None, connection: psycopg2.extensions.connection = None) -> None:
         """
-        Create a new table in the database with the given name and columns if it does not already exist.
+        Create the tables that do not exist yet in the database with the given names and columns.
+        The statements don't depend on each other, so they are sent to the server as a single batch in one round-trip.
 
         Args:
-            table_name (str): The name of the table to create.
-            columns (str): A string containing the column definitions for the table.
+            tables (list): A list of the tables from the configuration file, each one with the `name` and `columns` keys.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
 
         Examples:
             To create a new table called 'users' with columns 'id' and 'name', you can call the method like this:
-            >>> _create_table('users', 'id INTEGER PRIMARY KEY, name TEXT')
+            >>> _create_tables([{'name': 'users', 'columns': ['id INTEGER PRIMARY KEY, ', 'name TEXT']}])
+        """
+        if not tables:
+            return
+        statements = sql.SQL("; ").join(
+            sql.SQL(CREATE_TABLE_TEMPLATE).format(table=sql.Identifier(table['name']), columns=sql.SQL("".join(table['columns'])))
+            for table in tables
+        )
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(statements)
+
+    def _create_indexes(self, indexes: list = None, connection: psycopg2.extensions.connection = None) -> bool:
         """
-        conn = self.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})")
-        conn.commit()
-        self.close_connection(conn)
+        Create the indexes that do not exist yet in the database.
+        The existing indexes are checked with a single query, so nothing is executed on a regular start.
+        The database role may not be the owner of a table, in this case the index is skipped with a warning.
+        The same happens if the index uses a column that is added by a pending migration (the migrations run after the preparation).
+        Each index is created under a savepoint, so a skipped index doesn't abort the transaction of the caller.
+
+        Args:
+            indexes (list): A list of dictionaries with the index definitions
+                            (name, table, columns and optional include columns and partial index condition).
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
+
+        Returns:
+            bool: True if all indexes exist after the call, False if some of them were skipped.
+
+        Examples:
+            >>> _create_indexes([{'name': 'queue_post_id_idx', 'table': 'queue', 'columns': ['post_id']}])
+        """
+        existing_indexes = self._select(
+            table_name='pg_indexes', columns=('indexname',), condition="schemaname = %s", params=('public',), connection=connection
+        )
+        existing_indexes = {index[0] for index in existing_indexes} if existing_indexes else set()
+
+        created = True
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                for index in indexes:
+                    if index['name'] in existing_indexes:
+                        continue
+                    template = CREATE_INDEX_TEMPLATE
+                    if index.get('include', None):
+                        template += " INCLUDE ({include})"
+                    if index.get('condition', None):
+                        template += " WHERE {condition}"
+                    sql_query = sql.SQL(template).format(
+                        name=sql.Identifier(index['name']), table=sql.Identifier(index['table']),
+                        columns=sql.SQL(', ').join(sql.Identifier(column) for column in index['columns']),
+                        include=sql.SQL(', ').join(sql.Identifier(column) for column in index.get('include', None) or ()),
+                        condition=sql.SQL(index.get('condition', None) or '')
+                    )
+                    cursor.execute("SAVEPOINT create_index")
+                    try:
+                        cursor.execute(sql_query)
+                        cursor.execute("RELEASE SAVEPOINT create_index")
+                        log.info('[Database]: Prepare Database: index `%s` has been created', index['name'])
+                    except psycopg2.errors.InsufficientPrivilege as error:
+                        cursor.execute("ROLLBACK TO SAVEPOINT create_index")
+                        log.warning('[Database]: Prepare Database: index `%s` cannot be created by the current role: %s', index['name'], error)
+                        created = False
+                    except psycopg2.errors.UndefinedColumn as error:
+                        # the column is added by a migration that runs after the preparation, the index is created on the next start
+                        cursor.execute("ROLLBACK TO SAVEPOINT create_index")
+                        log.warning('[Database]: Prepare Database: index `%s` is waiting for the migration of the table: %s', index['name'], error)
+                        created = False
+        return created
 
     @reconnect_on_exception
-    def _insert(self, table_name: str = None, columns: tuple = None, values: tuple = None) -> None:
+    def _insert(
+        self, table_name: str = None, columns: tuple = None, values: tuple | list = None, conflict_target: str = None,
+        template: str = None, connection: psycopg2.extensions.connection = None
+    ) -> None:
         """
-        Inserts a new row into the specified table with the given columns and values.
+        Inserts one or more rows into the specified table with the given columns and values.
+        All rows are written with a single multi-row INSERT statement and one commit.
 
         Args:
             table_name (str): The name of the table to insert the row into.
             columns (tuple): A tuple containing the names of the columns to insert the values into.
-            values (tuple): A tuple containing the values to insert into the table.
+            values (tuple | list): A tuple containing the values of one row or a list of such tuples to insert into the table.
+            conflict_target (str): The unique columns of the table, rows that conflict with the existing ones on them are skipped.
+            template (str): The template of a row, e.g. "(%s, %s::timestamp)" to cast the values explicitly on the server side.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
+                The database errors are raised in this case, because the transaction of the caller can't be continued.
 
         Examples:
             >>> db_client._insert(
@@ -247,14 +693,22 @@ class DatabaseClient:
             ...   columns=('username', 'email'),
             ...   values=('john_doe', 'john_doe@example.com')
             ... )
+            >>> db_client._insert(
+            ...   table_name='users',
+            ...   columns=('username', 'email'),
+            ...   values=[('john_doe', 'john_doe@example.com'), ('jane_doe', 'jane_doe@example.com')]
+            ... )
         """
         try:
-            sql_query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute(sql_query, values)
-            conn.commit()
-            self.close_connection(conn)
+            sql_query = self._compose(
+                INSERT_CONFLICT_TEMPLATE if conflict_target else INSERT_TEMPLATE,
+                table_name=table_name, columns=columns, conflict_target=conflict_target
+            )
+            rows = values if isinstance(values, list) else [values]
+            with self._conn(connection) as conn:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, sql_query, rows, template=template, page_size=1000)
+            self._select_cache.invalidate(table_name)
         except IndexError as error:
             log.error(
                 '[Database]: An error occurred while inserting a row into the table %s: %s\nColumns: %s\nValues: %s\nQuery: %s',
@@ -270,6 +724,9 @@ class DatabaseClient:
                 '[Database]: A database-related error occurred: %s\nColumns: %s\nValues: %s\nQuery: %s',
                 error, columns, values, sql_query
             )
+            # the transaction of the caller is aborted by the failed query, so the caller must handle the error itself
+            if connection is not None:
+                raise
 
     @reconnect_on_exception
     def _select(self, table_name: str = None, columns: tuple = None, **kwargs) -> list | None:
@@ -281,73 +738,285 @@ class DatabaseClient:
             columns (tuple): A tuple containing the names of the columns to select.
 
         Keyword Args:
-            condition (str): The condition to use to select the data.
+            condition (str): The condition to use to select the data, values are passed as %s placeholders.
+            params (tuple): A tuple containing the values for the placeholders in the condition.
             order_by (str): The column to use for ordering the data.
             limit (int): The maximum number of rows to return.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller.
+            as_dict (bool): Return the rows as dictionaries where the keys are the column names. Default is False.
 
         Returns:
-            list: a list of tuples containing the selected data.
+            list: a list of tuples (or dictionaries) containing the selected data.
                 or
             None: if no data is found.
 
         Examples:
-            >>> _select(table_name='users', columns=('username', 'email'), condition="id=1")
+            >>> _select(table_name='users', columns=('username', 'email'), condition="id = %s", params=(1,))
             [('john_doe', 'john_doe@exmaple.com')]
         """
+        sql_query, params = self._select_query(table_name=table_name, columns=columns, **kwargs)
+        # the tables from CACHEABLE_TABLES are also changed by other clients, so the cached result lives only SELECT_CACHE_TTL seconds
+        cache_key = (
+            table_name, tuple(columns), kwargs.get('condition', None), kwargs.get('order_by', None), tuple(params), kwargs.get('as_dict', False)
+        ) if table_name in CACHEABLE_TABLES and not kwargs.get('connection', None) else None
+        if cache_key:
+            response = self._select_cache.get(cache_key, None)
+            if response is not None:
+                return response if response else None
+
+        with self._conn(kwargs.get('connection', None)) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor if kwargs.get('as_dict', False) else None) as cursor:
+                self._execute_query(cursor=cursor, sql_query=sql_query, params=params)
+                response = cursor.fetchall()
+        if cache_key:
+            self._select_cache.set(cache_key, response)
+        return response if response else None
+
+    def _select_iter(self, table_name: str = None, columns: tuple = None, itersize: int = SCAN_ITERSIZE, **kwargs):
+        """
+        Stream rows from the specified table as dictionaries using a server-side cursor.
+        The rows are fetched from the database in batches of `itersize` while they are iterated,
+        so large results are not materialized at once. The connection is held until the iteration is finished.
+        The lost connection is retried like in the reconnect_on_exception decorator, but only until the first row is yielded:
+        a stream that has already been partially consumed can't be restarted, the error is raised to the caller.
+
+        Args:
+            table_name (str): The name of the table to select data from.
+            columns (tuple): A tuple containing the names of the columns to select.
+            itersize (int): The number of rows fetched from the database per round-trip.
+
+        Keyword Args:
+            The same as for the _select() method.
+
+        Yields:
+            dict: A row of the selected data where the keys are the column names.
+
+        Examples:
+            >>> list(_select_iter(table_name='users', columns=('username', 'email'), condition="id = %s", params=(1,)))
+            [{'username': 'john_doe', 'email': 'john_doe@exmaple.com'}]
+        """
+        sql_query, params = self._select_query(table_name=table_name, columns=columns, **kwargs)
+        attempt = 0
+        while True:
+            streamed = False
+            try:
+                with self._conn() as conn:
+                    with conn.cursor(name=f"{table_name}_scan", cursor_factory=RealDictCursor) as cursor:
+                        cursor.itersize = itersize
+                        cursor.execute(sql_query, params)
+                        for row in cursor:
+                            streamed = True
+                            yield row
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as exception:
+                if streamed or attempt >= RECONNECT_RETRIES:
+                    log.error('[Database]: Failed to stream the rows from the %s table: %s', table_name, str(exception))
+                    raise
+                attempt += 1
+                log.warning('[Database]: Reconnection attempt %s/%s to stream the rows: %s', attempt, RECONNECT_RETRIES, str(exception))
+                time.sleep(random.uniform(0, min(RECONNECT_BASE_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)))
+                if attempt == 2:
+                    self.replace_connection_pool()
+
+    def _select_query(self, table_name: str = None, columns: tuple = None, **kwargs) -> tuple:
+        """
+        Build the SELECT query and its parameters for the _select() and _select_iter() methods.
+
+        Args:
+            table_name (str): The name of the table to select data from.
+            columns (tuple): A tuple containing the names of the columns to select.
+
+        Keyword Args:
+            The same as for the _select() method.
+
+        Returns:
+            tuple: The composed SQL query and a list of the parameters for the query.
+        """
         # base query
-        sql_query = f"SELECT {', '.join(columns)} FROM {table_name}"
+        template = "SELECT {columns} FROM {table}"
+        params = list(kwargs.get('params', None) or ())
 
         if kwargs.get('condition', None):
-            sql_query += f" WHERE {kwargs.get('condition')}"
+            template += " WHERE {condition}"
         if kwargs.get('order_by', None):
-            sql_query += f" ORDER BY {kwargs.get('order_by')}"
+            template += " ORDER BY {order_by}"
         if kwargs.get('limit', None):
-            sql_query += f" LIMIT {kwargs.get('limit')}"
+            template += " LIMIT %s"
+            params.append(kwargs.get('limit'))
+        sql_query = self._compose(
+            template, table_name=table_name, columns=columns, condition=kwargs.get('condition', None), order_by=kwargs.get('order_by', None)
+        )
+        return sql_query, params
+
+    def _compose(self, template: str = None, table_name: str = None, columns: tuple = (), **clauses) -> sql.Composed:
+        """
+        Compose a query from the template with the quoted table and column identifiers.
+        The composed query is cached, so the same query of a helper is built only once and then reused on each call.
 
-        conn = self.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql_query)
-            response = cursor.fetchall()
-        self.close_connection(conn)
+        Args:
+            template (str): The query template with the {table} and {columns} placeholders and a placeholder for each clause.
+            table_name (str): The name of the table.
+            columns (tuple): A tuple containing the names of the columns.
+
+        Keyword Args:
+            The SQL fragments of the query (e.g. condition="id = %s"), values must be passed only as %s placeholders.
+
+        Returns:
+            sql.Composed: The composed query.
+
+        Examples:
+            >>> _compose("SELECT {columns} FROM {table} WHERE {condition}", table_name='users', columns=('id',), condition="status = %s")
+            Composed([SQL('SELECT '), Composed([Identifier('id')]), SQL(' FROM '), Identifier('users'), ...])
+        """
+        key = (template, table_name, tuple(columns), tuple(sorted(clauses.items())))
+        query = self._sql_cache.get(key, None)
+        if query is None:
+            query = sql.SQL(template).format(
+                table=sql.Identifier(table_name),
+                columns=sql.SQL(', ').join(sql.Identifier(column) for column in columns),
+                **{name: sql.SQL(clause) for name, clause in clauses.items() if clause is not None}
+            )
+            self._sql_cache[key] = query
+        return query
+
+    @reconnect_on_exception
+    def _execute_prepared(self, name: str = None, params: tuple = None, lock_key: str = None) -> list | None:
+        """
+        Execute a server-side prepared statement and return the selected rows.
+        The statement is prepared from PREPARED_STATEMENTS the first time it is used on the connection.
+        Statements without a result (e.g. UPDATE without RETURNING) return None.
+        If the lock key is specified, the transaction takes the advisory lock of the key before the statement in the same round-trip,
+        so the statements with the same key are serialized and each of them sees the rows committed by the previous one.
+
+        Args:
+            name (str): The name of the prepared statement.
+            params (tuple): A tuple containing the values of the statement parameters.
+            lock_key (str): The key of the transaction-level advisory lock to take before the statement.
+
+        Returns:
+            list: a list of tuples containing the selected data.
+                or
+            None: if no data is found.
+
+        Examples:
+            >>> _execute_prepared(name='user_queue', params=('12345',))
+            [('123456789', datetime.datetime(2022, 1, 1, 12, 0))]
+        """
+        with self._conn() as conn:
+            with conn.cursor() as cursor:
+                if name not in conn.prepared_statements:
+                    cursor.execute(PREPARED_STATEMENTS[name])
+                    conn.prepared_statements.add(name)
+                statement = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})"
+                if lock_key is not None:
+                    statement = f"SELECT pg_advisory_xact_lock(hashtext(%s)); {statement}"
+                    params = (lock_key, *params)
+                cursor.execute(statement, params)
+                response = cursor.fetchall() if cursor.description else None
         return response if response else None
 
+    @staticmethod
+    def _execute_query(cursor: psycopg2.extensions.cursor = None, sql_query: sql.Composable = None, params: tuple | list = None) -> None:
+        """
+        Execute the query of a helper as a server-side prepared statement, so the server parses and plans it once per session.
+        The statement is named by the hash of the query text and prepared the first time it is used on the connection,
+        the least recently used statement is deallocated when the session has more than PREPARED_CACHE_SIZE of them.
+
+        Args:
+            cursor (psycopg2.extensions.cursor): A cursor of the connection to execute the query on.
+            sql_query (sql.Composable): The query with the %s placeholders.
+            params (tuple | list): The values for the placeholders in the query.
+
+        Examples:
+            >>> _execute_query(cursor=cursor, sql_query=sql.SQL("SELECT id FROM users WHERE user_id = %s"), params=('12345',))
+        """
+        params = tuple(params or ())
+        query = sql_query.as_string(cursor)
+        name = f"ps_{hashlib.sha1(query.encode('utf-8')).hexdigest()[:16]}"
+        prepared_queries = cursor.connection.prepared_queries
+        if name in prepared_queries:
+            prepared_queries.move_to_end(name)
+        else:
+            cursor.execute(f"PREPARE {name} AS {DatabaseClient._positional_query(query)}")
+            prepared_queries[name] = None
+            if len(prepared_queries) > PREPARED_CACHE_SIZE:
+                deallocated, _ = prepared_queries.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {deallocated}")
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}", params)
+
+    @staticmethod
+    def _positional_query(query: str = None) -> str:
+        """
+        Replace the %s placeholders of psycopg2 with the positional parameters of a server-side statement.
+        The placeholders are walked the same way psycopg2 does it, so the %% escape is turned into the percent sign and never into a parameter.
+
+        Args:
+            query (str): The query text with the %s placeholders.
+
+        Returns:
+            str: The query text with the $1, $2, ... parameters.
+
+        Examples:
+            >>> _positional_query("SELECT id FROM users WHERE user_id = %s AND chat_id LIKE '%%s'")
+            "SELECT id FROM users WHERE user_id = $1 AND chat_id LIKE '%s'"
+        """
+        positions = itertools.count(start=1)
+        return PLACEHOLDER_PATTERN.sub(lambda match: '%' if match.group() == '%%' else f"${next(positions)}", query)
+
     @reconnect_on_exception
-    def _update(self, table_name: str = None, values: str = None, condition: str = None) -> None:
+    def _update(
+        self, table_name: str = None, values: str = None, condition: str = None, params: tuple = None,
+        connection: psycopg2.extensions.connection = None
+    ) -> int:
         """
         Update the specified table with the given values of values based on the specified condition.
 
         Args:
             table_name (str): The name of the table to update.
-            values (str): The values of values to update in the table.
-            condition (str): The condition to use for updating the table.
+            values (str): The values of values to update in the table, values are passed as %s placeholders.
+            condition (str): The condition to use for updating the table, values are passed as %s placeholders.
+            params (tuple): A tuple containing the values for the placeholders in the values and then in the condition.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
+
+        Returns:
+            int: The number of updated rows.
 
         Examples:
-            >>> _update('users', "username='new_username', password='new_password'", "id=1")
+            >>> _update('users', "username = %s, password = %s", "id = %s", ('new_username', 'new_password', 1))
+            1
         """
-        conn = self.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(f"UPDATE {table_name} SET {values} WHERE {condition}")
-        conn.commit()
-        self.close_connection(conn)
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                self._execute_query(
+                    cursor=cursor, sql_query=self._compose(UPDATE_TEMPLATE, table_name=table_name, values=values, condition=condition), params=params
+                )
+                updated = cursor.rowcount
+        self._select_cache.invalidate(table_name)
+        return updated
 
     @reconnect_on_exception
-    def _delete(self, table_name: str = None, condition: str = None) -> None:
+    def _delete(
+        self, table_name: str = None, condition: str = None, params: tuple = None, connection: psycopg2.extensions.connection = None
+    ) -> None:
         """
         Delete rows from a table based on a condition.
 
         Args:
             table_name (str): The name of the table to delete rows from.
-            condition (str): The condition to use to determine which rows to delete.
+            condition (str): The condition to use to determine which rows to delete, values are passed as %s placeholders.
+            params (tuple): A tuple containing the values for the placeholders in the condition.
+            connection (psycopg2.extensions.connection): A connection with the transaction of the caller (optional).
 
         Examples:
             To delete all rows from the 'users' table where the 'username' column is 'john':
-            >>> db._delete('users', "username='john'")
+            >>> db._delete('users', "username = %s", ('john',))
         """
-        conn = self.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(f"DELETE FROM {table_name} WHERE {condition}")
-        conn.commit()
-        self.close_connection(conn)
+        with self._conn(connection) as conn:
+            with conn.cursor() as cursor:
+                self._execute_query(
+                    cursor=cursor, sql_query=self._compose(DELETE_TEMPLATE, table_name=table_name, condition=condition), params=params
+                )
+        self._select_cache.invalidate(table_name)
 
     def _reset_stale_records(self) -> None:
         """
@@ -356,14 +1025,13 @@ class DatabaseClient:
         """
         # Reset stale status_message (can be only one status_message per chat)
         log.info('[Database]: Resetting stale status messages...')
-        status_messages = self._select(table_name='messages', columns=("id", "state"), condition="message_type = 'status_message'")
-        if status_messages:
-            for message in status_messages:
-                if message[1] != 'updated':
-                    self._update(table_name='messages', values="state = 'updated'", condition=f"id = '{message[0]}'")
-                    log.info('[Database]: Stale status messages have been reset')
-                else:
-                    log.info('[Database]: No stale status messages found')
+        reset_messages = self._update(
+            table_name='messages', values="state = %s", condition="message_type = %s AND state <> %s", params=('updated', 'status_message', 'updated')
+        )
+        if reset_messages:
+            log.info('[Database]: %s stale status messages have been reset', reset_messages)
+        else:
+            log.info('[Database]: No stale status messages found')
 
     def add_message_to_queue(self, data: dict = None) -> str:
         """
@@ -403,44 +1071,51 @@ class DatabaseClient:
             >>> database.add_message_to_queue(data=data)
             'abcde: added to queue'
         """
-        self._insert(
-            table_name='queue',
-            columns=(
-                "user_id", "post_id", "post_url", "post_owner", "link_type",
-                "message_id", "chat_id", "scheduled_time", "download_status", "upload_status"
-            ),
-            values=(
-                data.get('user_id', None), data.get('post_id', None), data.get('post_url', None), data.get('post_owner', None),
-                data.get('link_type', None), data.get('message_id', None), data.get('chat_id', None), data.get('scheduled_time', None),
-                data.get('download_status', 'not started'), data.get('upload_status', 'not started')
-            )
-        )
+        self._insert(table_name='queue', columns=QUEUE_COLUMNS, values=self._queue_row(data), template=QUEUE_TEMPLATE)
         return f"{data.get('message_id', None)}: added to queue"
 
+    @staticmethod
+    def _queue_row(data: dict = None) -> tuple:
+        """
+        Convert the message details to a row of the queue table in the order of QUEUE_COLUMNS.
+
+        Args:
+            data (dict): A dictionary containing the message details.
+
+        Returns:
+            tuple: A row for the queue table.
+        """
+        return (
+            data.get('user_id', None), data.get('post_id', None), data.get('post_url', None), data.get('post_owner', None),
+            data.get('link_type', None), data.get('message_id', None), data.get('chat_id', None), data.get('scheduled_time', None),
+            data.get('download_status', 'not started'), data.get('upload_status', 'not started')
+        )
+
     def get_message_from_queue(self, scheduled_time: str = None) -> tuple:
         """
         Get a one message from the queue table that is scheduled to be sent at the specified time.
         The message will be returned before or equal to the specified timestamp in the argument.
+        The oldest message is returned first.
+        The message is not claimed: it stays in the queue until its state is updated, so the queue is designed for a single handler thread.
 
         Args:
             scheduled_time (str): The time at which the message is scheduled to be sent.
 
         Returns:
-            tuple: A tuple containing the message from the queue.
+            tuple: A tuple containing the message from the queue (id, user_id, post_id, post_url, post_owner, link_type,
+                   message_id, chat_id, scheduled_time, download_status, upload_status, state).
 
         Examples:
             >>> database.get_message_from_queue('2022-01-01 12:00:00')
-            (1, '123456789', 'vahj5AN8aek', 'https://www.example.com/p/vahj5AN8aek', 'johndoe', 'post', '12345', '12346', '123456789',
-            datetime.datetime(2023, 11, 14, 21, 21, 22, 603440), 'None', 'None', datetime.datetime(2023, 11, 14, 21, 14, 26, 680024), 'waiting')
+            (1, '123456789', 'vahj5AN8aek', 'https://www.example.com/p/vahj5AN8aek', 'johndoe', 'post', '12345', '12346',
+            datetime.datetime(2023, 11, 14, 21, 21, 22, 603440), 'not started', 'not started', 'waiting')
         """
-        message = self._select(
-            table_name='queue', columns=("*"), condition=f"scheduled_time <= '{scheduled_time}' AND state IN ('waiting', 'processing')", limit=1
-        )
+        message = self._execute_prepared(name='queue_due', params=(scheduled_time,))
         return message[0] if message else None
 
     def update_message_state_in_queue(self, post_id: str = None, state: str = None, **kwargs) -> str:
         """
-        Update the state of a message in the queue table and move it to the processed table if the state is 'processed'.
+        Update the state of a message in the queue table or move it to the processed table if the state is 'processed'.
 
         Args:
             post_id (str): The ID of the post.
@@ -469,33 +1144,27 @@ class DatabaseClient:
                 )
             '456: processed'
         """
-        values = f"state = '{state}'"
-
-        if kwargs.get('post_owner'):
-            values += f", post_owner = '{kwargs.get('post_owner')}'"
-        if kwargs.get('download_status'):
-            values += f", download_status = '{kwargs.get('download_status')}'"
-        if kwargs.get('upload_status'):
-            values += f", upload_status = '{kwargs.get('upload_status')}'"
-
-        self._update(table_name='queue', values=values, condition=f"post_id = '{post_id}'")
-
         if state == 'processed':
-            processed_message = self._select(table_name='queue', columns=("*"), condition=f"post_id = '{post_id}'", limit=1)
-            self._insert(
-                table_name='processed',
-                columns=(
-                    "user_id", "post_id", "post_url", "post_owner", "link_type", "message_id", "chat_id", "download_status", "upload_status", "state"
-                ),
-                values=(
-                    processed_message[0][1], processed_message[0][2], processed_message[0][3], processed_message[0][4],
-                    processed_message[0][5], processed_message[0][6], processed_message[0][7],
+            # the message is moved from the queue to the processed table with a single atomic statement
+            processed_message = self._execute_prepared(
+                name='queue_processed',
+                params=(
+                    post_id, kwargs.get('post_owner') or None,
                     kwargs.get('download_status', 'pending'), kwargs.get('upload_status', 'pending'), state
                 )
             )
-            self._delete(table_name='queue', condition=f"post_id = '{post_id}'")
-            response = f"{processed_message[0][6]}: processed"
+            if processed_message:
+                response = f"{processed_message[0][0]}: processed"
+            else:
+                log.warning('[Database]: Message with post ID %s was not found in the queue and cannot be moved to the processed table', post_id)
+                response = f"{post_id}: not found in queue"
         else:
+            self._execute_prepared(
+                name='queue_state',
+                params=(
+                    state, kwargs.get('post_owner') or None, kwargs.get('download_status') or None, kwargs.get('upload_status') or None, post_id
+                )
+            )
             response = f"{post_id}: state updated"
 
         return response
@@ -516,9 +1185,35 @@ class DatabaseClient:
             >>> update_schedule_time_in_queue(post_id='123', user_id='12345', scheduled_time='2022-01-01 12:00:00')
             '123: scheduled time updated'
         """
-        self._update(table_name='queue', values=f"scheduled_time = '{scheduled_time}'", condition=f"post_id = '{post_id}' AND user_id = '{user_id}'")
+        self._execute_prepared(name='queue_reschedule', params=(scheduled_time, post_id, str(user_id)))
         return f"{post_id}: scheduled time updated"
 
+    @reconnect_on_exception
+    def update_schedule_times_in_queue(self, user_id: str = None, schedule: list = None) -> str:
+        """
+        Update the scheduled time of several messages in the queue table with a single query.
+
+        Args:
+            user_id (str): The ID of the user.
+            schedule (list): A list of tuples containing the ID of the post and the new scheduled time for the message.
+
+        Returns:
+            str: A response message indicating the status of the update.
+
+        Examples:
+            >>> update_schedule_times_in_queue(user_id='12345', schedule=[('123', '2022-01-01 12:00:00'), ('456', '2022-01-01 12:05:00')])
+            '2 messages: scheduled time updated'
+        """
+        if schedule:
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor, QUEUE_SCHEDULE_QUERY,
+                        [(post_id, scheduled_time, str(user_id)) for post_id, scheduled_time in schedule],
+                        template=QUEUE_SCHEDULE_TEMPLATE, page_size=1000
+                    )
+        return f"{len(schedule) if schedule else 0} messages: scheduled time updated"
+
     def get_user_queue(self, user_id: str = None) -> dict:
         """
         Get messages from the queue table for the specified user.
@@ -533,14 +1228,8 @@ class DatabaseClient:
             >>> get_user_queue(user_id='12345')
             [{'post_id': '123456789', 'scheduled_time': '2022-01-01 12:00:00'}]
         """
-        result = []
-        queue = self._select(
-            table_name='queue', columns=("post_id", "scheduled_time"), condition=f"user_id = '{user_id}'", order_by='scheduled_time ASC', limit=10000
-        )
-        if queue:
-            for message in queue:
-                result.append({'post_id': message[0], 'scheduled_time': message[1]})
-        return result
+        queue = self._execute_prepared(name='user_queue', params=(str(user_id),))
+        return [{'post_id': message[0], 'scheduled_time': message[1]} for message in queue] if queue else []
 
     def get_user_processed(self, user_id: str = None) -> dict:
         """
@@ -557,15 +1246,29 @@ class DatabaseClient:
             >>> get_user_processed(user_id='12345')
             [{'post_id': '123456789', 'timestamp': '2022-01-01 12:00:00', 'state': 'processed'}]
         """
-        result = []
         processed = self._select(
             table_name='processed', columns=("post_id", "timestamp", "state"),
-            condition=f"user_id = '{user_id}'", order_by='timestamp ASC', limit=10000
+            condition="user_id = %s", params=(str(user_id),), order_by='timestamp ASC', limit=10000, as_dict=True
         )
-        if processed:
-            for message in processed:
-                result.append({'post_id': message[0], 'timestamp': message[1], 'state': message[2]})
-        return result
+        return [dict(message) for message in processed] if processed else []
+
+    @reconnect_on_exception
+    def get_messages_stats(self) -> dict:
+        """
+        Get the number of processed and queued messages of all users from the users table with a single query.
+
+        Returns:
+            dict: A dictionary containing the number of processed and queued messages.
+
+        Examples:
+            >>> get_messages_stats()
+            {'processed': 10, 'queue': 3}
+        """
+        with self._conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(MESSAGES_STATS_QUERY)
+                processed, queue = cursor.fetchone()
+        return {'processed': processed, 'queue': queue}
 
     def check_message_uniqueness(self, post_id: str = None, user_id: str = None) -> bool:
         """
@@ -582,16 +1285,15 @@ class DatabaseClient:
             >>> check_message_uniqueness(post_id='12345', user_id='67890')
             True
         """
-        queue = self._select(table_name='queue', columns=("id",), condition=f"post_id = '{post_id}' AND user_id = '{user_id}'", limit=1)
-        processed = self._select(table_name='processed', columns=("id",), condition=f"post_id = '{post_id}' AND user_id = '{user_id}'", limit=1)
-        if queue or processed:
-            return False
-        return True
+        exists = self._execute_prepared(name='uniq', params=(post_id, str(user_id)))
+        return not exists[0][0]
 
     def keep_message(self, message_id: str = None, chat_id: str = None, message_content: str | dict = None, **kwargs) -> str:
         """
         Add a message to the messages table in the database.
         It is used to store the last message sent to the user for updating the message in the future.
+        The message is inserted or updated with a single upsert query.
+        If the message ID, the content and the state are the same as in the stored row, the row is not updated at all.
 
         Args:
             message_id (str): The ID of the message.
@@ -608,51 +1310,62 @@ class DatabaseClient:
 
         Examples:
             >>> keep_message('12345', '67890', 'Hello, World!', message_type='status_message', state='updated')
-            '12345 kept' or '12345 updated'
+            '12345 kept' or '12345 updated' or '12345 unchanged'
         """
         message_type = kwargs.get('message_type', None)
         state = kwargs.get('state', 'updated')
         recreated = kwargs.get('recreated', False)
         message_content_hash = get_hash(message_content)
-        check_exist_message_type = self._select(
-            table_name='messages', columns=("id", "message_id"), condition=f"message_type = '{message_type}' AND chat_id = '{chat_id}'"
-        )
-        response = None
-
-        if check_exist_message_type and recreated:
-            self._update(
-                table_name='messages',
-                values=(
-                    f"message_content_hash = '{message_content_hash}', message_id = '{message_id}', "
-                    f"state = '{state}', updated_at = CURRENT_TIMESTAMP, created_at = CURRENT_TIMESTAMP"
-                ),
-                condition=f"id = '{check_exist_message_type[0][0]}'"
-            )
-            response = f"{message_id} recreated"
-
-        elif check_exist_message_type and not recreated:
-            self._update(
-                table_name='messages',
-                values=(
-                    f"message_content_hash = '{message_content_hash}', message_id = '{message_id}', state = '{state}', updated_at = CURRENT_TIMESTAMP"
-                ),
-                condition=f"id = '{check_exist_message_type[0][0]}'"
-            )
-            response = f"{message_id} updated"
+        cache_key = (message_type, str(chat_id))
+
+        # a refresh of the message with the same content doesn't need a round-trip to the database
+        with self._messages_cache_lock:
+            exist_message = self._messages_cache.get(cache_key, None)
+        if exist_message and not recreated and exist_message[1:] == (str(message_id), message_content_hash, state):
+            return f"{message_id} unchanged"
+
+        message = self._execute_prepared(
+            name='message_keep', params=(message_type, str(chat_id), str(message_id), message_content_hash, state, bool(recreated)),
+            lock_key=f"messages:{message_type}:{chat_id}"
+        )[0]
+        self._cache_message(cache_key, message[:4])
+        self._considered_cache.pop(cache_key)
+        action = 'recreated' if recreated and message[4] == 'updated' else message[4]
+        return f"{message_id} {action}"
+
+    def _cache_message(self, key: tuple = None, row: tuple = None) -> None:
+        """
+        Put the row of the messages table to the messages cache and evict the least recently used entry if the cache is full.
 
-        elif not check_exist_message_type:
-            self._insert(
-                table_name='messages',
-                columns=("message_id", "chat_id", "message_type", "message_content_hash", "producer"),
-                values=(message_id, chat_id, message_type, message_content_hash, 'bot')
-            )
-            response = f"{message_id} kept"
+        Args:
+            key (tuple): The message type and the ID of the chat.
+            row (tuple): The ID of the row, the ID of the message, the hash of the message content and the state of the message.
+        """
+        with self._messages_cache_lock:
+            self._messages_cache[key] = row
+            self._messages_cache.move_to_end(key)
+            if len(self._messages_cache) > MESSAGES_CACHE_SIZE:
+                self._messages_cache.popitem(last=False)
 
-        else:
-            log.warning('[Database]: Message with ID %s already exists in the messages table and cannot be updated', message_id)
-            response = f"{message_id} already exists"
+    def invalidate_message_cache(self, chat_id: str = None, message_type: str = None) -> None:
+        """
+        Drop the cached messages table rows for the specified chat.
+        It should be called when the messages table is changed outside of this client.
 
-        return response
+        Args:
+            chat_id (str): The ID of the chat.
+            message_type (str): The type of the message. If not specified, the rows of all message types are dropped.
+
+        Examples:
+            >>> invalidate_message_cache(chat_id='12345', message_type='status_message')
+        """
+        with self._messages_cache_lock:
+            for key in [key for key in self._messages_cache if key[1] == str(chat_id) and message_type in (None, key[0])]:
+                del self._messages_cache[key]
+        if message_type is None:
+            self._considered_cache.invalidate()
+        else:
+            self._considered_cache.pop((message_type, str(chat_id)))
 
     def get_users(self, only_allowed: bool = True) -> dict:
         """
@@ -670,20 +1383,40 @@ class DatabaseClient:
             >>> get_users()
             [{'user_id': '12345', 'chat_id': '67890', 'status': 'denied'}, {'user_id': '12346', 'chat_id': '67891', 'status': 'allowed'}]
         """
-        users_dict = []
         if only_allowed:
-            users = self._select(table_name='users', columns=("user_id", "chat_id", "status"), condition="status = 'allowed'", limit=1000)
+            users = self._select(
+                table_name='users', columns=("user_id", "chat_id", "status"), condition="status = %s", params=('allowed',), limit=1000, as_dict=True
+            )
         else:
-            users = self._select(table_name='users', columns=("user_id", "chat_id", "status"), limit=1000)
+            users = self._select(table_name='users', columns=("user_id", "chat_id", "status"), limit=1000, as_dict=True)
+
+        return [dict(user) for user in users] if users else []
+
+    def iter_users(self, only_allowed: bool = True, itersize: int = SCAN_ITERSIZE):
+        """
+        Stream all users with their metadata from the users table in the database using a server-side cursor.
+        Unlike get_users(), the number of users is not limited and they are not materialized at once,
+        but the connection is held until the iteration is finished, so it should not be used for slow loops.
 
-        if users:
-            for user in users:
-                users_dict.append({'user_id': user[0], 'chat_id': user[1], 'status': user[2]})
-        return users_dict
+        Args:
+            only_allowed (bool): A flag indicating whether to return only allowed users. Default is True.
+            itersize (int): The number of users fetched from the database per round-trip.
+
+        Yields:
+            dict: A user and its metadata.
+
+        Examples:
+            >>> list(iter_users(only_allowed=False))
+            [{'user_id': '12345', 'chat_id': '67890', 'status': 'denied'}, {'user_id': '12346', 'chat_id': '67891', 'status': 'allowed'}]
+        """
+        condition = {'condition': "status = %s", 'params': ('allowed',)} if only_allowed else {}
+        for user in self._select_iter(table_name='users', columns=("user_id", "chat_id", "status"), itersize=itersize, **condition):
+            yield dict(user)
 
     def get_considered_message(self, message_type: str = None, chat_id: str = None) -> tuple:
         """
         Get a message with specified type and chat ID from the messages table in the database.
+        The found message is cached for CONSIDERED_CACHE_TTL seconds or until it is changed by keep_message().
 
         Args:
             message_type (str): The type of the message.
@@ -697,17 +1430,21 @@ class DatabaseClient:
             # ('message_id', 'chat_id', 'created_at', 'updated_at', 'message_content_hash', 'state')
             ('123456789', '12345', datetime.datetime, datetime.datetime, 'hash', 'updated')
         """
-        message = self._select(
-            table_name='messages',
-            columns=("message_id", "chat_id", "created_at", "updated_at", "message_content_hash", "state"),
-            condition=f"message_type = '{message_type}' AND chat_id = '{chat_id}'",
-            limit=1
-        )
-        return message[0] if message else None
+        cache_key = (message_type, str(chat_id))
+        message = self._considered_cache.get(cache_key, None)
+        if message is None:
+            message = self._execute_prepared(name='considered_message', params=cache_key)
+            message = message[0] if message else None
+            if message:
+                self._considered_cache.set(cache_key, message)
+        return message
 
+    @reconnect_on_exception
     def add_account_info(self, data: dict = None) -> None:
         """
-        Add account information to the accounts table in the database.
+        Add account information to the accounts table in the database or update the existing account with a single query.
+        Only the passed keys are written, so a new account must contain all required keys.
+        Query errors are logged, the lost connection errors are raised to the reconnect decorator.
 
         Args:
             data (dict): A dictionary containing the account details. Keep only the necessary keys.
@@ -723,20 +1460,25 @@ class DatabaseClient:
         """
         keys_to_keep = ['username', 'pk', 'full_name', 'media_count', 'follower_count', 'following_count', 'cursor']
         filtered_dict = {key: data[key] for key in keys_to_keep if key in data}
-        exist_account = self._select(table_name='accounts', columns=("id",), condition=f"username = '{data.get('username')}'")
 
-        if exist_account:
-            self._update(
-                table_name='accounts',
-                values=", ".join(f"{key} = '{value}'" for key, value in filtered_dict.items()),
-                condition=f"id = '{exist_account[0][0]}'"
-            )
-        else:
-            self._insert(table_name='accounts', columns=tuple(filtered_dict.keys()), values=tuple(filtered_dict.values()))
+        sql_query = self._compose(
+            ACCOUNT_UPSERT_TEMPLATE, table_name='accounts', columns=tuple(filtered_dict.keys()),
+            values=", ".join(f"{key} = %s" for key in filtered_dict), placeholders=", ".join(['%s'] * len(filtered_dict))
+        )
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql_query, (*filtered_dict.values(), data.get('username'), *filtered_dict.values()))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except psycopg2.Error as error:
+            log.error('[Database]: Failed to save the account information: %s\nValues: %s', error, filtered_dict)
+        self._select_cache.invalidate('accounts')
 
     def get_account_info(self, username: str = None) -> tuple:
         """
         Get the account information from the accounts table in the database.
+        The result is cached for SELECT_CACHE_TTL seconds and invalidated when the account information is changed by add_account_info().
 
         Args:
             username (str): The username of the account.
@@ -746,5 +1488,5 @@ class DatabaseClient:
                 pk (int): The primary key of the account.
                 cursor (str): The cursor for the account.
         """
-        account = self._select(table_name='accounts', columns=("pk", "cursor"), condition=f"username = '{username}'", limit=1)
+        account = self._select(table_name='accounts', columns=("pk", "cursor"), condition="username = %s", params=(username,), limit=1)
         return account[0] if account else (None, None)
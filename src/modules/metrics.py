@@ -61,10 +61,9 @@ class Metrics():
         """
         The method collects information about users access status and updates the gauge.
         """
-        users_dict = self.database.get_users(only_allowed=False)
         access_granted_count = 0
         access_denied_count = 0
-        for user in users_dict:
+        for user in self.database.iter_users(only_allowed=False):
             if user.get('status') == 'denied':
                 access_denied_count += 1
             elif user.get('status') == 'allowed':
@@ -83,19 +82,9 @@ class Metrics():
         """
         The method updates the gauge with the number of processed and queued messages.
         """
-        processed_messages_count = 0
-        queue_messages_count = 0
-        users_dict = self.database.get_users(only_allowed=False)
-
-        for user in users_dict:
-            processed_messages = self.database.get_user_processed(user_id=user['user_id'])
-            queue_messages = self.database.get_user_queue(user_id=user['user_id'])
-            if processed_messages:
-                processed_messages_count += len(processed_messages)
-            if queue_messages:
-                queue_messages_count += len(queue_messages)
-        self.processed_messages_counter.set(processed_messages_count)
-        self.queue_length_gauge.set(queue_messages_count)
+        messages_stats = self.database.get_messages_stats()
+        self.processed_messages_counter.set(messages_stats['processed'])
+        self.queue_length_gauge.set(messages_stats['queue'])
 
     def run(self, threads: list) -> None:
         """
@@ -1,5 +1,8 @@
 """This module contains the tools for this python project"""
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 
 def get_hash(data: str | dict = None) -> str:
@@ -21,3 +24,84 @@ def get_hash(data: str | dict = None) -> str:
         data = str(data)
     hasher.update(data.encode('utf-8'))
     return hasher.hexdigest()
+
+
+class TTLCache:
+    """
+    A small thread-safe in-memory cache where each entry expires after the specified time to live.
+    The keys are tuples where the first element is a namespace (e.g. a table name), so all entries of the namespace can be invalidated at once.
+
+    Attributes:
+        maxsize (int): The maximum number of entries in the cache, the oldest entry is evicted when the cache is full.
+        ttl (int): The time to live of an entry in seconds.
+
+    Examples:
+        >>> cache = TTLCache(maxsize=256, ttl=30)
+        >>> cache.set(('users', 'all'), [('12345', '67890', 'allowed')])
+        >>> cache.get(('users', 'all'))
+        [('12345', '67890', 'allowed')]
+        >>> cache.invalidate('users')
+    """
+    def __init__(self, maxsize: int = 256, ttl: int = 30) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple = None, default: object = None) -> object:
+        """
+        Get the value of the key if it exists and has not expired.
+
+        Args:
+            key (tuple): The key of the entry.
+            default (object): The value to return if the entry doesn't exist or has expired.
+
+        Returns:
+            object: The cached value or the default value.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return default
+            return entry[1]
+
+    def set(self, key: tuple = None, value: object = None) -> None:
+        """
+        Put the value to the cache.
+
+        Args:
+            key (tuple): The key of the entry.
+            value (object): The value to cache.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: tuple = None) -> None:
+        """
+        Drop the entry of the key if it exists.
+
+        Args:
+            key (tuple): The key of the entry.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self, namespace: str = None) -> None:
+        """
+        Drop all entries of the namespace, or all entries if the namespace is not specified.
+
+        Args:
+            namespace (str): The first element of the keys to drop.
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == namespace]:
+                    del self._entries[key]
@@ -4,13 +4,17 @@ This module contains tests for the database module.
 import os
 import sys
 import json
+import time
 import importlib
+import threading
+from types import SimpleNamespace
 from datetime import datetime, timedelta
 import pytest
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import pool, sql
+from src.modules import database
 from src.modules.tools import get_hash
-from src.modules.database import DatabaseClient
+from src.modules.database import DatabaseClient, reconnect_on_exception, load_database_configuration
 
 
 # pylint: disable=too-many-locals
@@ -25,7 +29,7 @@ def test_init_database_client(vault_configuration_data, postgres_instance, datab
     # Check general attributes
     assert isinstance(database_class.vault, object)
     assert isinstance(database_class.db_role, str)
-    assert isinstance(database_class.database_connections, pool.SimpleConnectionPool)
+    assert isinstance(database_class.database_connections, pool.ThreadedConnectionPool)
 
     # Check tables creation in the database
     cursor.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public'")
@@ -425,3 +429,412 @@ def test_service_messages(database_class):
     assert recreated_message[3] != updated_message[3]
     assert recreated_message[4] == get_hash(data['message_content'])
     assert recreated_message[5] == 'updated'
+
+
+@pytest.mark.order(18)
+def test_change_messages_schedule_time_in_queue(database_class, postgres_instance):
+    """
+    Checking the change of the schedule time of several messages in the queue with a single query
+    """
+    _, cursor = postgres_instance
+    data_list = [
+        {
+            'user_id': 'test_case_18',
+            'post_id': f"test_case_18_{i}",
+            'post_url': f"https://example.com/p/test_case_18_{i}",
+            'post_owner': 'test_case_18',
+            'link_type': 'post',
+            'message_id': f"test_case_18_{i}",
+            'chat_id': 'test_case_18',
+            'scheduled_time': '2099-01-01 12:00:00'
+        } for i in range(3)
+    ]
+    for data in data_list:
+        status = database_class.add_message_to_queue(data=data)
+        assert status == f"{data['message_id']}: added to queue"
+
+    schedule = [(data['post_id'], datetime(2099, 1, 2, 12, i)) for i, data in enumerate(data_list)]
+    status = database_class.update_schedule_times_in_queue(user_id='test_case_18', schedule=schedule)
+    assert status == f"{len(schedule)} messages: scheduled time updated"
+
+    # Check records in database
+    cursor.execute("SELECT post_id, scheduled_time FROM queue WHERE user_id = 'test_case_18' ORDER BY post_id")
+    assert cursor.fetchall() == schedule
+
+
+@pytest.mark.order(19)
+def test_service_messages_cache(database_class, postgres_instance):
+    """
+    Checking that the messages cache falls back to the database when the cached row is stale
+    """
+    conn, cursor = postgres_instance
+    data = {
+        'message_id': 'test_case_19',
+        'chat_id': 'test_case_19',
+        'message_content': 'Test case 19',
+        'message_type': 'status_message',
+        'state': 'updated'
+    }
+    status = database_class.keep_message(**data)
+    assert status == f"{data['message_id']} kept"
+    status = database_class.keep_message(**data)
+    assert status == f"{data['message_id']} updated"
+
+    # The same message is not written again
+    status = database_class.keep_message(**data)
+    assert status == f"{data['message_id']} unchanged"
+
+    # Remove the cached row outside of the client
+    cursor.execute("DELETE FROM messages WHERE chat_id = %s", (data['chat_id'],))
+    conn.commit()
+    data['message_content'] = 'Test case 19 updated'
+    status = database_class.keep_message(**data)
+    assert status == f"{data['message_id']} kept"
+
+    # Check the explicit invalidation of the cache
+    database_class.invalidate_message_cache(chat_id=data['chat_id'])
+    status = database_class.keep_message(**data)
+    assert status == f"{data['message_id']} updated"
+    cursor.execute("SELECT COUNT(*) FROM messages WHERE chat_id = %s", (data['chat_id'],))
+    assert cursor.fetchone()[0] == 1
+
+
+@pytest.mark.order(20)
+def test_get_messages_stats(database_class, postgres_instance):
+    """
+    Checking the number of processed and queued messages of the known users
+    """
+    _, cursor = postgres_instance
+    stats = database_class.get_messages_stats()
+    cursor.execute("SELECT COUNT(*) FROM processed WHERE user_id IN (SELECT user_id FROM users)")
+    assert stats['processed'] == cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM queue WHERE user_id IN (SELECT user_id FROM users)")
+    assert stats['queue'] == cursor.fetchone()[0]
+
+
+@pytest.mark.order(22)
+def test_iter_users(database_class, postgres_instance):
+    """
+    Checking the streaming of users from the users table
+    """
+    conn, cursor = postgres_instance
+    cursor.execute(
+        "INSERT INTO users (user_id, chat_id, status) VALUES ('test_case_22_1', 'test_case_22_1', 'allowed'), "
+        "('test_case_22_2', 'test_case_22_2', 'denied') ON CONFLICT (user_id) DO NOTHING"
+    )
+    conn.commit()
+
+    all_users = list(database_class.iter_users(only_allowed=False, itersize=1))
+    allowed_users = list(database_class.iter_users())
+    assert {'user_id': 'test_case_22_1', 'chat_id': 'test_case_22_1', 'status': 'allowed'} in all_users
+    assert {'user_id': 'test_case_22_2', 'chat_id': 'test_case_22_2', 'status': 'denied'} in all_users
+    assert {'user_id': 'test_case_22_1', 'chat_id': 'test_case_22_1', 'status': 'allowed'} in allowed_users
+    assert all(user['status'] == 'allowed' for user in allowed_users)
+    cursor.execute("SELECT COUNT(*) FROM users")
+    assert len(all_users) == cursor.fetchone()[0]
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(23)
+def test_create_indexes_before_migration(database_class):
+    """
+    Checking that the index on a column added by a pending migration is skipped and created on the next start
+    """
+    table_name = 'test_case_23_messages'
+    # the messages table before the 0002_messages_table migration: without the created_at and state columns
+    connection = database_class.get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {table_name} (id SERIAL PRIMARY KEY, message_id VARCHAR(255) NOT NULL, chat_id VARCHAR(255) NOT NULL, "
+            "timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, message_type VARCHAR(255) NOT NULL, "
+            "producer VARCHAR(255) NOT NULL, message_content_hash VARCHAR(64) NOT NULL)"
+        )
+    connection.commit()
+    indexes = [
+        {'name': f"{table_name}_message_type_state_idx", 'table': table_name, 'columns': ['message_type', 'state']},
+        {'name': f"{table_name}_chat_id_message_type_idx", 'table': table_name, 'columns': ['chat_id', 'message_type']}
+    ]
+
+    # The transaction is not aborted by the missing column, the other indexes are created
+    assert database_class._create_indexes(indexes=indexes) is False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (table_name,))
+        assert {index[0] for index in cursor.fetchall()} == {f"{table_name}_pkey", f"{table_name}_chat_id_message_type_idx"}
+
+    # The skipped index is created after the migration
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN state VARCHAR(255) DEFAULT 'added'")
+    connection.commit()
+    assert database_class._create_indexes(indexes=indexes) is True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (table_name,))
+        assert f"{table_name}_message_type_state_idx" in {index[0] for index in cursor.fetchall()}
+        cursor.execute(f"DROP TABLE {table_name}")
+    connection.commit()
+    database_class.close_connection(connection)
+
+
+@pytest.mark.order(24)
+def test_account_info(database_class, postgres_instance):
+    """
+    Checking the addition of a new account and the update of the existing account with only the changed columns
+    """
+    _, cursor = postgres_instance
+    data = {
+        'username': 'test_case_24',
+        'pk': 24,
+        'full_name': 'Test case 24',
+        'media_count': 10,
+        'follower_count': 20,
+        'following_count': 30,
+        'cursor': None
+    }
+    database_class.add_account_info(data=data)
+    assert database_class.get_account_info(username=data['username']) == (24, None)
+
+    # Update the existing account with only the username and the cursor
+    database_class.add_account_info(data={'username': data['username'], 'cursor': 'test_case_24_cursor'})
+    assert database_class.get_account_info(username=data['username']) == (24, 'test_case_24_cursor')
+    cursor.execute("SELECT COUNT(*), MAX(full_name), MAX(media_count) FROM accounts WHERE username = %s", (data['username'],))
+    assert cursor.fetchone() == (1, data['full_name'], data['media_count'])
+
+    # A new account without the required columns is not added
+    database_class.add_account_info(data={'username': 'test_case_24_incomplete', 'cursor': 'test_case_24_cursor'})
+    assert database_class.get_account_info(username='test_case_24_incomplete') == (None, None)
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(25)
+def test_insert_with_caller_transaction(database_class):
+    """
+    Checking that a failed insert in the transaction of the caller is raised instead of being only logged
+    """
+    connection = database_class.get_connection()
+    with pytest.raises(psycopg2.errors.NotNullViolation):
+        database_class._insert(table_name='users', columns=('user_id', 'chat_id'), values=('test_case_25', None), connection=connection)
+    connection.rollback()
+    database_class.close_connection(connection)
+
+    # Without the transaction of the caller the error is only logged
+    database_class._insert(table_name='users', columns=('user_id', 'chat_id'), values=('test_case_25', None))
+    assert database_class._select(table_name='users', columns=('user_id',), condition="user_id = %s", params=('test_case_25',)) is None
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(26)
+def test_positional_query():
+    """
+    Checking the replacement of the psycopg2 placeholders with the positional parameters of a prepared statement
+    """
+    assert DatabaseClient._positional_query("SELECT 1") == "SELECT 1"
+    assert DatabaseClient._positional_query(
+        "SELECT id FROM users WHERE user_id = %s AND chat_id = %s"
+    ) == "SELECT id FROM users WHERE user_id = $1 AND chat_id = $2"
+    # The escaped percent sign is not a placeholder
+    assert DatabaseClient._positional_query(
+        "SELECT id FROM users WHERE user_id = %s AND chat_id LIKE '%%s' AND status = %s"
+    ) == "SELECT id FROM users WHERE user_id = $1 AND chat_id LIKE '%s' AND status = $2"
+    assert DatabaseClient._positional_query("SELECT '100%%' WHERE %s") == "SELECT '100%' WHERE $1"
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(27)
+def test_prepared_queries_cache(database_class, monkeypatch):
+    """
+    Checking that the least recently used prepared statement of the helpers is deallocated when the session has too many of them
+    """
+    monkeypatch.setattr(database, 'PREPARED_CACHE_SIZE', 2)
+    connection = database_class.get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute("DEALLOCATE ALL")
+        connection.prepared_queries.clear()
+        connection.prepared_statements.clear()
+
+        queries = [sql.SQL(f"SELECT %s::int + {number}") for number in range(1, 4)]
+        DatabaseClient._execute_query(cursor=cursor, sql_query=queries[0], params=(1,))
+        DatabaseClient._execute_query(cursor=cursor, sql_query=queries[1], params=(1,))
+        first_statement, second_statement = connection.prepared_queries
+        # The reused statement becomes the most recently used one
+        DatabaseClient._execute_query(cursor=cursor, sql_query=queries[0], params=(1,))
+        assert cursor.fetchone() == (2,)
+        DatabaseClient._execute_query(cursor=cursor, sql_query=queries[2], params=(1,))
+        assert cursor.fetchone() == (4,)
+
+        assert second_statement not in connection.prepared_queries
+        assert list(connection.prepared_queries)[0] == first_statement
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        assert {statement[0] for statement in cursor.fetchall()} == set(connection.prepared_queries)
+    connection.rollback()
+    database_class.close_connection(connection)
+
+
+@pytest.mark.order(28)
+def test_reconnect_on_exception(monkeypatch):
+    """
+    Checking the retries of a method with the randomized backoff after the lost connection and the rebuilding of the pool
+    """
+    delays = []
+    monkeypatch.setattr(database, 'time', SimpleNamespace(sleep=delays.append, monotonic=time.monotonic))
+
+    class Client:
+        """A client whose method fails the specified number of times"""
+        def __init__(self, failures: int = 0, error: type = psycopg2.OperationalError) -> None:
+            self.failures = failures
+            self.error = error
+            self.calls = 0
+            self.pools = 0
+            self.database_connections = None
+
+        def replace_connection_pool(self) -> None:
+            """Count the rebuilt pools"""
+            self.pools += 1
+
+        @reconnect_on_exception
+        def query(self, connection: object = None) -> str:
+            """Fail the first calls"""
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise self.error('connection lost')
+            return 'ok'
+
+    # The first retry uses the same pool
+    client = Client(failures=1)
+    assert client.query() == 'ok'
+    assert (client.calls, client.pools) == (2, 0)
+
+    # The pool is rebuilt only once if the database is still unreachable
+    delays.clear()
+    client = Client(failures=2)
+    assert client.query() == 'ok'
+    assert (client.calls, client.pools) == (3, 1)
+    for attempt, delay in enumerate(delays, start=1):
+        assert 0 <= delay <= min(database.RECONNECT_BASE_DELAY * 2 ** attempt, database.RECONNECT_MAX_DELAY)
+
+    # The number of retries is limited
+    delays.clear()
+    client = Client(failures=100)
+    with pytest.raises(psycopg2.OperationalError):
+        client.query()
+    assert (client.calls, client.pools, len(delays)) == (database.RECONNECT_RETRIES + 1, 1, database.RECONNECT_RETRIES)
+
+    # The query errors are not retried
+    delays.clear()
+    client = Client(failures=1, error=psycopg2.ProgrammingError)
+    with pytest.raises(psycopg2.ProgrammingError):
+        client.query()
+    assert (client.calls, client.pools, delays) == (1, 0, [])
+
+    # The method with the connection of the caller is not retried on the same connection
+    client = Client(failures=1)
+    with pytest.raises(psycopg2.OperationalError):
+        client.query(connection=object())
+    assert (client.calls, client.pools, delays) == (1, 0, [])
+
+
+@pytest.mark.order(29)
+def test_idle_connection_probe(database_class, postgres_instance):
+    """
+    Checking that an idle connection broken on the server side is replaced before it is checked out
+    """
+    _, cursor = postgres_instance
+    connection = database_class.get_connection()
+    backend_pid = connection.get_backend_pid()
+    database_class.close_connection(connection)
+    connection.last_used = time.monotonic() - database.IDLE_PROBE_AFTER - 1
+    cursor.execute("SELECT pg_terminate_backend(%s)", (backend_pid,))
+
+    new_connection = database_class.get_connection()
+    assert new_connection.get_backend_pid() != backend_pid
+    with new_connection.cursor() as new_cursor:
+        new_cursor.execute("SELECT 1")
+        assert new_cursor.fetchone() == (1,)
+    new_connection.rollback()
+    database_class.close_connection(new_connection)
+    assert connection.closed
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(30)
+def test_schema_digest(database_class, postgres_instance, monkeypatch):
+    """
+    Checking that the schema preparation is skipped for the same configuration file and retried while some indexes are missing
+    """
+    conn, cursor = postgres_instance
+    configuration_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/configs/databases.json'))
+    _, schema_digest = load_database_configuration(path=configuration_path)
+    cursor.execute("SELECT value FROM schema_meta WHERE name = 'schema_digest'")
+    saved_digest = cursor.fetchone()
+    cursor.execute("DELETE FROM schema_meta WHERE name = 'schema_digest'")
+    conn.commit()
+
+    # The digest is not saved while some indexes are skipped
+    monkeypatch.setattr(database_class, '_create_indexes', lambda **kwargs: False)
+    database_class._prepare_db()
+    assert database_class._get_schema_digest() is None
+
+    # The digest is saved for the complete schema
+    monkeypatch.setattr(database_class, '_create_indexes', lambda **kwargs: True)
+    database_class._prepare_db()
+    assert database_class._get_schema_digest() == schema_digest
+
+    # The preparation is skipped for the same configuration file
+    def create_tables(**kwargs):
+        raise AssertionError(f"The schema is prepared again: {kwargs}")
+    monkeypatch.setattr(database_class, '_create_tables', create_tables)
+    database_class._prepare_db()
+
+    cursor.execute("DELETE FROM schema_meta WHERE name = 'schema_digest'")
+    if saved_digest:
+        cursor.execute("INSERT INTO schema_meta (name, value) VALUES ('schema_digest', %s)", saved_digest)
+    conn.commit()
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(34)
+def test_replace_connection_pool(database_class):
+    """
+    Checking that the replaced connection pool is closed together with its connections, including the connections in use
+    """
+    old_connections = database_class.database_connections
+    connection = database_class.get_connection()
+    database_class.replace_connection_pool()
+    assert old_connections.closed
+    assert connection.closed
+    assert database_class.database_connections is not old_connections
+
+    # The connection in use is returned to the closed pool without an error
+    database_class._put_connection(connections=old_connections, connection=connection)
+    assert database_class.get_users(only_allowed=False) is not None
+
+
+@pytest.mark.order(36)
+def test_keep_message_concurrently(database_class, postgres_instance):
+    """
+    Checking that the first write of a service message waits for the concurrent write of the same message instead of inserting a duplicate row
+    """
+    conn, cursor = postgres_instance
+    data = {
+        'message_id': 'test_case_36',
+        'chat_id': 'test_case_36',
+        'message_content': 'Test case 36',
+        'message_type': 'status_message',
+        'state': 'updated'
+    }
+    statuses = []
+
+    # The concurrent writer holds the lock of the message until its row is committed
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"messages:{data['message_type']}:{data['chat_id']}",))
+    thread = threading.Thread(target=lambda: statuses.append(database_class.keep_message(**data)))
+    thread.start()
+    thread.join(timeout=1)
+    assert thread.is_alive()
+    cursor.execute(
+        "INSERT INTO messages (message_id, chat_id, message_type, message_content_hash, producer) VALUES (%s, %s, %s, 'hash', 'pytest')",
+        (data['message_id'], data['chat_id'], data['message_type'])
+    )
+    conn.commit()
+    thread.join(timeout=10)
+
+    assert statuses == [f"{data['message_id']} updated"]
+    cursor.execute("SELECT COUNT(*) FROM messages WHERE chat_id = %s", (data['chat_id'],))
+    assert cursor.fetchone()[0] == 1
@@ -1,7 +1,9 @@
 """
 This module contains tests for the database module.
 """
+import threading
 import requests
+import psycopg2
 import pytest
 
 
@@ -57,3 +59,29 @@ def test_metrics_messages(metrics_class, postgres_queue_test_data, postgres_proc
     assert "pytest_queue_length" in response.text
     assert "pytest_processed_messages_total 3.0" in response.text
     assert "pytest_queue_length 3.0" in response.text
+
+
+# pylint: disable=protected-access
+@pytest.mark.order(35)
+def test_metrics_users_stats_reconnect(metrics_class, database_class, postgres_instance, monkeypatch):
+    """
+    Checking that the collection of user statistics survives the lost connection before the users are streamed.
+    """
+    _, cursor = postgres_instance
+    get_connection = database_class._get_connection
+    thread_id = threading.get_ident()
+    failures = []
+
+    def broken_get_connection(*args, **kwargs):
+        if threading.get_ident() == thread_id and not failures:
+            failures.append(True)
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        return get_connection(*args, **kwargs)
+
+    monkeypatch.setattr(database_class, '_get_connection', broken_get_connection)
+    metrics_class.collect_users_stats()
+    assert failures == [True]
+
+    cursor.execute("SELECT COUNT(*) FROM users WHERE status = 'allowed'")
+    response = requests.get(f"http://0.0.0.0:{metrics_class.port}/", timeout=10)
+    assert f"pytest_access_granted_total {float(cursor.fetchone()[0])}" in response.text
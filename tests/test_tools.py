@@ -0,0 +1,54 @@
+"""
+This module contains tests for the tools module.
+"""
+import time
+import pytest
+from src.modules.tools import get_hash, TTLCache
+
+
+@pytest.mark.order(31)
+def test_get_hash():
+    """
+    Checking the hash of the string and the dictionary content
+    """
+    assert get_hash('Test case 31') == get_hash('Test case 31')
+    assert get_hash('Test case 31') != get_hash('Test case 31 updated')
+    assert get_hash({'test_case': 31}) == get_hash(str({'test_case': 31}))
+    assert len(get_hash('Test case 31')) == 64
+
+
+@pytest.mark.order(32)
+def test_ttl_cache_expiration():
+    """
+    Checking the expiration of the cache entries after the time to live
+    """
+    cache = TTLCache(maxsize=2, ttl=0.1)
+    cache.set(('users', 'test_case_32'), [])
+    assert cache.get(('users', 'test_case_32'), None) == []
+    time.sleep(0.2)
+    assert cache.get(('users', 'test_case_32'), 'expired') == 'expired'
+
+
+@pytest.mark.order(33)
+def test_ttl_cache_invalidation():
+    """
+    Checking the eviction of the oldest entry and the invalidation of the cache entries
+    """
+    cache = TTLCache(maxsize=3, ttl=30)
+    cache.set(('users', 1), 'user 1')
+    cache.set(('users', 2), 'user 2')
+    cache.set(('accounts', 1), 'account 1')
+    cache.set(('accounts', 2), 'account 2')
+    assert cache.get(('users', 1)) is None
+    assert cache.get(('users', 2)) == 'user 2'
+
+    cache.pop(('accounts', 2))
+    assert cache.get(('accounts', 2)) is None
+    assert cache.get(('accounts', 1)) == 'account 1'
+
+    cache.invalidate('users')
+    assert cache.get(('users', 2)) is None
+    assert cache.get(('accounts', 1)) == 'account 1'
+
+    cache.invalidate()
+    assert cache.get(('accounts', 1)) is None